@@ -1,29 +1,237 @@
+import os
+import re
+from functools import lru_cache
+from importlib import metadata
+from typing import Dict, Iterable, List, Optional, Type
+
+from . import instrument
+from .cache import CorrectionCache, normalize_query, unique_queries
+
+
+def _package_version(package: str) -> str:
+    try:
+        return metadata.version(package)
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
 class AutoCorrectI:
     def __init__(self) -> None:
-        pass
+        # Optional persistent cache, consulted by `fix_queries`
+        self.cache: Optional[CorrectionCache] = None
+
+    @property
+    def name(self) -> str:
+        """The name of the correcter, as used in the registry and in output filenames."""
+        return self.__class__.__name__.lower()
+
+    @property
+    def version(self) -> str:
+        """The version of the correcter or its model, used to invalidate cached corrections.
+        Designed to be overridden by subclasses.
+        """
+        return "0"
 
     def fix_query(self, query: str) -> str:
         raise NotImplementedError()
 
+    def correct_batch(self, queries: List[str], batch_size: int = 32) -> List[str]:
+        """Correct a list of queries, preserving their order.
+        Applies `fix_query` on each query by default, designed to be
+        overridden by correcters that support batched inference.
+        """
+        name = f"fix_query.{self.name}"
+        fixed = []
+        for query in queries:
+            with instrument.timer(name):
+                fixed.append(self.fix_query(query))
+        return fixed
+
+    def fix_queries(self, queries: List[str], batch_size: int = 32) -> List[str]:
+        """Correct a list of queries, preserving their order.
+        Queries are deduplicated by their normalization, and only the first of
+        each that is missing from `self.cache` (if set) is passed to `correct_batch`.
+        Queries are returned unchanged, byte for byte, unless their correction
+        differs in more than whitespace.
+
+        :param queries: The queries to correct.
+        :type queries: List[str]
+        :param batch_size: The maximum number of queries per batch of batched inference,
+            see `correct_batch`, defaults to 32
+        :type batch_size: int, optional
+        :return: The corrected queries, in the same order as `queries`.
+        :rtype: List[str]
+        """
+        name = self.name
+        with instrument.timer(f"fix_queries.{name}", len(queries)):
+            unique = unique_queries(queries)
+            fixed = {}
+            if self.cache is not None:
+                fixed = self.cache.get_many(name, self.version, unique)
+            missing = [key for key in unique if key not in fixed]
+            if missing:
+                corrected = list(
+                    zip(
+                        missing,
+                        self.correct_batch(
+                            [unique[key] for key in missing], batch_size
+                        ),
+                    )
+                )
+                fixed.update(corrected)
+                if self.cache is not None:
+                    self.cache.put_many(name, self.version, corrected)
+            fixed_queries = []
+            for query in queries:
+                key = normalize_query(query)
+                # Keep the original whitespace of queries the correcter did not change
+                fixed_query = fixed[key]
+                if normalize_query(fixed_query) == key:
+                    fixed_query = query
+                fixed_queries.append(fixed_query)
+        if instrument.is_enabled():
+            instrument.count(f"queries.{name}", len(queries))
+            instrument.count(f"corrected.{name}", len(missing))
+            instrument.count(
+                f"changed.{name}",
+                sum(
+                    query != fixed_query
+                    for query, fixed_query in zip(queries, fixed_queries)
+                ),
+            )
+        return fixed_queries
+
+    def warm_up(self) -> None:
+        """Hook to pay one-off costs (e.g. lazy weight loading, first
+        forward pass) before timing-sensitive work starts.
+        Designed to be overridden by subclasses.
+        """
+        self.fix_query("warm up")
+
 
 class Autocorrect(AutoCorrectI):
-    def __init__(self) -> None:
+    """Word modification correcter using `autocorrect.Speller`.
+    Each distinct token is only corrected once, after which it is
+    served from a bounded LRU cache of `cache_size` tokens.
+    """
+
+    # The English word pattern that `Speller` applies on sentences
+    TOKEN_PATTERN = re.compile(r"[A-Za-z]+")
+
+    def __init__(self, cache_size: int = 2**16) -> None:
         super().__init__()
         from autocorrect import Speller
 
         self.fix = Speller()
+        self.fix_token = lru_cache(maxsize=cache_size)(self.fix.autocorrect_word)
+
+    @property
+    def version(self) -> str:
+        return _package_version("autocorrect")
 
     def fix_query(self, query: str) -> str:
-        return self.fix(query)
+        return self.TOKEN_PATTERN.sub(
+            lambda match: self.fix_token(match.group(0)), query
+        )
+
+    def cache_info(self) -> Dict[str, int]:
+        """Return hit/miss statistics of the token cache."""
+        info = self.fix_token.cache_info()
+        return {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "max_size": info.maxsize,
+        }
+
+
+class SymspellCorrecter(AutoCorrectI):
+    """Symmetric delete correcter over `data/raw/english_words` and the corrections
+    in the parsed corpora. Tokens that are not in this vocabulary are replaced by the
+    closest word within `max_distance` edits, if any. The index is built once and
+    persisted to `filename`.
+    """
+
+    TOKEN_PATTERN = re.compile(r"[A-Za-z]+")
+
+    def __init__(
+        self,
+        filename: str = "data/processed/symspell.pickle",
+        max_distance: int = 2,
+        cache_size: int = 2**16,
+    ) -> None:
+        super().__init__()
+        from .parser import parse_all
+        from .symspell import SymSpellIndex, vocabulary_counts, vocabulary_digest
+
+        # Building the vocabulary is cheap, unlike the index, which is only rebuilt
+        # if it was built from a different vocabulary or `max_distance`
+        counts = vocabulary_counts(parsed_errors=parse_all())
+        self.index = None
+        if os.path.exists(filename):
+            self.index = SymSpellIndex.load(filename)
+        if (
+            self.index is None
+            or self.index.max_distance != max_distance
+            or getattr(self.index, "digest", None) != vocabulary_digest(counts)
+        ):
+            self.index = SymSpellIndex(counts, max_distance=max_distance)
+            self.index.save(filename)
+        self.fix_token = lru_cache(maxsize=cache_size)(self._fix_token)
+
+    @property
+    def version(self) -> str:
+        return (
+            f"{self.index.max_distance}-{self.index.prefix_length}"
+            f"-{self.index.digest[:16]}"
+        )
+
+    def _fix_token(self, token: str) -> str:
+        fixed = self.index.lookup(token.lower())
+        if fixed is None or fixed == token.lower():
+            return token
+        if len(token) > 1 and token.isupper():
+            return fixed.upper()
+        if token[0].isupper():
+            return fixed.capitalize()
+        return fixed
+
+    def fix_query(self, query: str) -> str:
+        return self.TOKEN_PATTERN.sub(
+            lambda match: self.fix_token(match.group(0)), query
+        )
 
 
 class NeuspellCorrecter(AutoCorrectI):
     def __init__(self) -> None:
         super().__init__()
 
+    @property
+    def version(self) -> str:
+        return _package_version("neuspell")
+
     def fix_query(self, query: str) -> str:
         return self.checker.correct(query)
 
+    def correct_batch(self, queries: List[str], batch_size: int = 32) -> List[str]:
+        """Correct `queries` with batched inference, passing `batch_size` queries
+        at a time to `checker.correct_strings`, which in turn splits them into
+        forward passes of its own fixed batch size. Queries are sorted by their
+        number of characters, which follows the number of subword and character
+        inputs of the models more closely than the number of words, so the
+        queries of a forward pass need little padding.
+        """
+        order = sorted(range(len(queries)), key=lambda i: len(queries[i]))
+        fixed = [None] * len(queries)
+        name = f"correct_batch.{self.name}"
+        for start in range(0, len(order), batch_size):
+            indices = order[start : start + batch_size]
+            with instrument.timer(name, len(indices)):
+                corrected = self.checker.correct_strings([queries[i] for i in indices])
+            for i, fixed_query in zip(indices, corrected):
+                fixed[i] = fixed_query
+        return fixed
+
 
 class BertsclstmCorrecter(NeuspellCorrecter):
     """BERT + SC-LSTM"""
@@ -113,12 +321,159 @@ class ElmosclstmCorrecter(NeuspellCorrecter):
         self.checker.from_pretrained()
 
 
-autocorrecters = [Autocorrect(), BertCorrecter()]
+class VocabularyGate(AutoCorrectI):
+    """Gate in front of another correcter, which only passes on queries with at
+    least one suspicious token: an alphabetic token that is not in the vocabulary
+    of `data/raw/english_words` and `data/raw/filter.dat`. All other queries are
+    returned untouched, without calling `correcter`.
+    """
+
+    TOKEN_PATTERN = re.compile(r"[A-Za-z]+")
+
+    def __init__(
+        self,
+        correcter: AutoCorrectI,
+        word_files: Iterable[str] = (
+            "data/raw/english_words/words_subset1.txt",
+            "data/raw/english_words/words_subset2.txt",
+            "data/raw/filter.dat",
+        ),
+    ) -> None:
+        super().__init__()
+        self.correcter = correcter
+        vocabulary = set()
+        for filename in word_files:
+            with open(filename, "r", encoding="utf8") as f:
+                vocabulary.update(word.strip().lower() for word in f)
+        self.vocabulary = frozenset(vocabulary)
+        self.checked = 0
+        self.skipped = 0
+
+    @property
+    def name(self) -> str:
+        return GATE_PREFIX + self.correcter.name
+
+    @property
+    def version(self) -> str:
+        return self.correcter.version
+
+    def is_suspicious(self, query: str) -> bool:
+        """Return whether `query` contains a token that is not in the vocabulary."""
+        return any(
+            token.lower() not in self.vocabulary
+            for token in self.TOKEN_PATTERN.findall(query)
+        )
+
+    def fix_query(self, query: str) -> str:
+        return self.fix_queries([query])[0]
+
+    def fix_queries(self, queries: List[str], batch_size: int = 32) -> List[str]:
+        # Counted before deduplication, so `skip_rate` is per input query
+        self.checked += len(queries)
+        self.skipped += sum(not self.is_suspicious(query) for query in queries)
+        return super().fix_queries(queries, batch_size)
+
+    def correct_batch(self, queries: List[str], batch_size: int = 32) -> List[str]:
+        suspicious = [i for i, query in enumerate(queries) if self.is_suspicious(query)]
+        fixed = list(queries)
+        if suspicious:
+            corrected = self.correcter.fix_queries(
+                [queries[i] for i in suspicious], batch_size=batch_size
+            )
+            for i, fixed_query in zip(suspicious, corrected):
+                fixed[i] = fixed_query
+        return fixed
+
+    def skip_rate(self) -> float:
+        """Return the fraction of the queries passed to `fix_queries`, duplicates
+        included, that were passed through untouched."""
+        return self.skipped / max(self.checked, 1)
+
+    def warm_up(self) -> None:
+        self.correcter.warm_up()
+
+
+CORRECTERS: Dict[str, Type[AutoCorrectI]] = {
+    correcter.__name__.lower(): correcter
+    for correcter in [
+        Autocorrect,
+        SymspellCorrecter,
+        BertsclstmCorrecter,
+        CnnlstmCorrecter,
+        NestedlstmCorrecter,
+        SclstmCorrecter,
+        SclstmbertCorrecter,
+        BertCorrecter,
+        SclstmelmoCorrecter,
+        ElmosclstmCorrecter,
+    ]
+}
+
+# Names of the correcters used in the experiments. Only names are stored here,
+# so importing this module never loads a model.
+autocorrecters = ["autocorrect", "bertcorrecter"]
+
+# e.g. "gatedbertcorrecter" is "bertcorrecter" behind a `VocabularyGate`
+GATE_PREFIX = "gated"
+
+_loaded: Dict[str, AutoCorrectI] = {}
+
+
+def get_correcter(name: str) -> AutoCorrectI:
+    """Return the correcter registered under `name`, building it
+    the first time it is requested.
+
+    :param name: The lowercase class name of the correcter, e.g. "bertcorrecter",
+        optionally prefixed with "gated" to place it behind a `VocabularyGate`.
+    :type name: str
+    :return: The (cached) correcter instance.
+    :rtype: AutoCorrectI
+    """
+    if name not in _loaded and name.startswith(GATE_PREFIX):
+        _loaded[name] = VocabularyGate(get_correcter(name[len(GATE_PREFIX) :]))
+    elif name not in _loaded:
+        try:
+            correcter_class = CORRECTERS[name]
+        except KeyError:
+            raise KeyError(
+                f"Unknown correcter {name!r}, expected one of {sorted(CORRECTERS)}."
+            ) from None
+        with instrument.timer(f"load.{name}"):
+            _loaded[name] = correcter_class()
+    return _loaded[name]
+
+
+def release_correcter(name: str) -> None:
+    """Drop the cached instance of correcter `name`, if any,
+    so its model can be garbage collected.
+    """
+    _loaded.pop(name, None)
+
+
+def warm_up(names: Iterable[str]) -> List[AutoCorrectI]:
+    """Build and warm up the correcters in `names`.
+
+    :param names: Registered correcter names.
+    :type names: Iterable[str]
+    :return: The warmed up correcters, in the order of `names`.
+    :rtype: List[AutoCorrectI]
+    """
+    correcters = [get_correcter(name) for name in names]
+    for correcter in correcters:
+        correcter.warm_up()
+    return correcters
+
 
 __all__ = [
     "AutoCorrectI",
     "Autocorrect",
+    "SymspellCorrecter",
+    "VocabularyGate",
     "autocorrecters",
+    "CORRECTERS",
+    "get_correcter",
+    "release_correcter",
+    "warm_up",
     "NeuspellCorrecter",
     "BertsclstmCorrecter",
     "CnnlstmCorrecter",
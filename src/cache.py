@@ -0,0 +1,104 @@
+import os
+import sqlite3
+from typing import Dict, Iterable, List, Tuple
+
+
+def normalize_query(query: str) -> str:
+    """Collapse all whitespace in `query`, so trivially different
+    query strings share a single cache entry.
+    """
+    return " ".join(query.split())
+
+
+class CorrectionCache:
+    """Persistent on-disk cache of query corrections, stored in SQLite.
+    Entries are keyed by the correcter name, the correcter (model) version
+    and the normalized query text, so changing either the correcter or its
+    model automatically invalidates the old entries.
+
+    e.g:
+
+        cache = CorrectionCache("data/cache/corrections.sqlite")
+        cache.put_many("BertCorrecter", "0.9.0", [("helo world", "hello world")])
+        cache.get_many("BertCorrecter", "0.9.0", ["helo world"])
+    """
+
+    # Stay below SQLite's limit on the number of host parameters per statement
+    MAX_PARAMETERS = 500
+
+    def __init__(self, filename: str = "data/cache/corrections.sqlite"):
+        self.filename = filename
+        if os.path.dirname(filename):
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS corrections ("
+            "correcter TEXT NOT NULL, "
+            "version TEXT NOT NULL, "
+            "query TEXT NOT NULL, "
+            "fixed TEXT NOT NULL, "
+            "PRIMARY KEY (correcter, version, query)"
+            ") WITHOUT ROWID"
+        )
+        self.connection.commit()
+
+    def get_many(
+        self, correcter: str, version: str, queries: Iterable[str]
+    ) -> Dict[str, str]:
+        """Return a mapping from each query in `queries` that is present
+        in the cache to its cached correction.
+
+        :param correcter: The name of the correcter, e.g. "BertCorrecter".
+        :type correcter: str
+        :param version: The version of the correcter or its model.
+        :type version: str
+        :param queries: Normalized queries to look up.
+        :type queries: Iterable[str]
+        :return: Mapping of cached queries to their corrections.
+        :rtype: Dict[str, str]
+        """
+        queries = list(queries)
+        found = {}
+        for start in range(0, len(queries), self.MAX_PARAMETERS):
+            chunk = queries[start : start + self.MAX_PARAMETERS]
+            placeholders = ", ".join("?" * len(chunk))
+            found.update(
+                self.connection.execute(
+                    "SELECT query, fixed FROM corrections "
+                    f"WHERE correcter = ? AND version = ? AND query IN ({placeholders})",
+                    (correcter, version, *chunk),
+                )
+            )
+        return found
+
+    def put_many(
+        self, correcter: str, version: str, corrections: Iterable[Tuple[str, str]]
+    ) -> None:
+        """Store `(query, fixed)` pairs from `corrections`, and commit
+        them to disk immediately so they survive a crash.
+        """
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO corrections VALUES (?, ?, ?, ?)",
+            ((correcter, version, query, fixed) for query, fixed in corrections),
+        )
+        self.connection.commit()
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM corrections").fetchone()[0]
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def unique_queries(queries: List[str]) -> Dict[str, str]:
+    """Return a mapping from the distinct normalized queries in `queries` to the
+    first original query with that normalization, in order of first appearance.
+    """
+    unique = {}
+    for query in queries:
+        unique.setdefault(normalize_query(query), query)
+    return unique
+
+
+__all__ = ["CorrectionCache", "normalize_query", "unique_queries"]
@@ -0,0 +1,137 @@
+import json
+import os
+from typing import ContextManager, Iterable, Iterator, List, TextIO, Tuple
+
+
+class QueryWriter:
+    """Writer of fixed queries to an already opened `file` context,
+    e.g. stdout or a gzip file. Does not support resuming.
+    """
+
+    def __init__(self, file: ContextManager[TextIO]):
+        self.context = file
+        self.file = None
+
+    def skip(self, queries: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, str]]:
+        """Yield the rows of `queries` that still need to be written."""
+        return iter(queries)
+
+    def write(self, chunk: List[Tuple[str, str]], fixed: List[str]) -> None:
+        """Write the fixed queries of `chunk`."""
+        self.file.writelines(
+            f"{qid}\t{fixed_query}\n" for (qid, _), fixed_query in zip(chunk, fixed)
+        )
+
+    def __enter__(self) -> "QueryWriter":
+        self.file = self.context.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.context.__exit__(exc_type, exc_value, traceback)
+
+
+class CheckpointedWriter(QueryWriter):
+    """Crash-safe writer of fixed queries to `output`.
+    Rows are written to `{output}.partial`, and every `checkpoint_every` rows
+    the file is fsynced and the number of completed rows, the last completed
+    qid and the file size are recorded in `{output}.checkpoint`. When a run is
+    restarted, the partial file is truncated to the last checkpoint and `skip`
+    drops the rows that were already written. Without a checkpoint, the partial
+    file is discarded. Once all rows are written, the partial file is atomically
+    moved to `output`.
+
+    e.g:
+
+        with CheckpointedWriter("data/queries/bertcorrecter_fixed_queries.tsv") as writer:
+            for chunk in chunked(writer.skip(queries), 4096):
+                writer.write(chunk, correct(chunk))
+    """
+
+    def __init__(self, output: str, checkpoint_every: int = 10_000):
+        self.output = output
+        self.partial = f"{output}.partial"
+        self.checkpoint = f"{output}.checkpoint"
+        self.checkpoint_every = checkpoint_every
+        self.rows = 0
+        self.last_qid = None
+        self.checkpointed_rows = 0
+        # Whether the last call of `write` completed, i.e. the file ends at a row
+        self.clean = True
+        self.file = None
+
+        if os.path.exists(self.checkpoint) and os.path.exists(self.partial):
+            with open(self.checkpoint, "r", encoding="utf8") as f:
+                state = json.load(f)
+            self.rows = self.checkpointed_rows = state["rows"]
+            self.last_qid = state["qid"]
+            # Discard anything written after the last checkpoint
+            with open(self.partial, "r+b") as f:
+                f.truncate(state["offset"])
+        else:
+            # Without a checkpoint, nothing written by a previous run can be trusted
+            for filename in (self.checkpoint, self.partial):
+                if os.path.exists(filename):
+                    os.remove(filename)
+
+    def skip(self, queries: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, str]]:
+        """Yield the rows of `queries` that have not been written by a previous run."""
+        queries = iter(queries)
+        skipped, qid = 0, None
+        while skipped < self.rows:
+            try:
+                qid, _ = next(queries)
+            except StopIteration:
+                break
+            skipped += 1
+        if qid != self.last_qid:
+            raise ValueError(
+                f"The checkpoint of {self.output!r} ends at qid {self.last_qid} "
+                f"(row {self.rows}), but the input has qid {qid} there."
+            )
+        yield from queries
+
+    def write(self, chunk: List[Tuple[str, str]], fixed: List[str]) -> None:
+        """Write the fixed queries of `chunk`, checkpointing when due."""
+        self.clean = False
+        super().write(chunk, fixed)
+        self.clean = True
+        if chunk:
+            self.rows += len(chunk)
+            self.last_qid = chunk[-1][0]
+        if self.rows - self.checkpointed_rows >= self.checkpoint_every:
+            self.save()
+
+    def save(self) -> None:
+        """Fsync the written rows and atomically record a checkpoint."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        state = {"rows": self.rows, "qid": self.last_qid, "offset": self.file.tell()}
+        with open(f"{self.checkpoint}.tmp", "w", encoding="utf8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{self.checkpoint}.tmp", self.checkpoint)
+        self.checkpointed_rows = self.rows
+
+    def __enter__(self) -> "CheckpointedWriter":
+        self.file = open(self.partial, "a", encoding="utf8", buffering=1 << 20)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is not None:
+            # Keep the progress made so far, so a rerun continues from here. After
+            # an interrupted `write`, the file may end within a chunk, so the rerun
+            # truncates it to the last checkpoint instead.
+            if self.clean:
+                self.save()
+            self.file.close()
+            return
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.partial, self.output)
+        if os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+
+__all__ = ["QueryWriter", "CheckpointedWriter"]
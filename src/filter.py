@@ -1,11 +1,10 @@
-import json
+from lexicon import Lexicon
 
 with open('data/raw/english_words/words_subset2.txt') as word_file3:
     all_words_subset2 = set(word.strip().lower() for word in word_file3)
 
-#Store parsed.json in dictionary
-with open('data/processed/parsed.json') as parsed_file:
-    parsed = json.load(parsed_file)
+#Memory-map the compiled counterpart of parsed.json
+parsed = Lexicon('data/processed/parsed.lex')
 
 def is_english_word(word, english_words):
     """
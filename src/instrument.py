@@ -0,0 +1,245 @@
+import atexit
+import json
+import math
+import os
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+# Instrumentation is disabled by default. It can be enabled with `enable`, or for any
+# entry point by setting `IRSC_REPORT` to the path of the JSON report to write on exit.
+# `IRSC_PROFILE` and `IRSC_TRACEMALLOC` optionally list comma-separated stage prefixes
+# to capture with cProfile and tracemalloc, e.g. `IRSC_PROFILE=parse,fix_queries`.
+_enabled = False
+_profile_prefixes = ()
+_memory_prefixes = ()
+_stages: Dict[str, "StageStats"] = {}
+_counters: Counter = Counter()
+_profiles: Dict[str, object] = {}
+# The timers that trace memory and are running, innermost last
+_memory_timers: List["Timer"] = []
+
+
+class StageStats:
+    """Accumulated timings of a stage, with a histogram of per-call latencies in
+    power-of-two buckets of microseconds."""
+
+    __slots__ = ("calls", "items", "seconds", "max_seconds", "buckets", "peak_memory")
+
+    def __init__(self):
+        self.calls = 0
+        self.items = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets: Counter = Counter()
+        self.peak_memory = 0
+
+    def add(self, seconds: float, items: int) -> None:
+        self.calls += 1
+        self.items += items
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        # frexp(x)[1] is the exponent e with 2 ** (e - 1) <= x < 2 ** e
+        self.buckets[math.frexp(seconds * 1e6)[1]] += 1
+
+    def to_dict(self) -> Dict:
+        stats = {
+            "calls": self.calls,
+            "items": self.items,
+            "seconds": self.seconds,
+            "items_per_s": self.items / self.seconds if self.seconds else None,
+            "mean_ms": self.seconds / self.calls * 1e3 if self.calls else None,
+            "max_ms": self.max_seconds * 1e3,
+            "histogram_us": {
+                f"<{2 ** exponent}": count
+                for exponent, count in sorted(self.buckets.items())
+            },
+        }
+        if self.peak_memory:
+            stats["peak_memory_bytes"] = self.peak_memory
+        return stats
+
+
+class Timer:
+    """Context manager timing a single call of stage `name`. Set `items` inside
+    the block if the number of processed items is only known afterwards."""
+
+    __slots__ = ("name", "items", "start", "profile", "memory", "peak")
+
+    def __init__(self, name: str, items: int = 1):
+        self.name = name
+        self.items = items
+        self.profile = None
+        # None if memory is not traced, otherwise whether this timer started tracing
+        self.memory = None
+        # The peak traced memory of this stage, before the peak was last reset
+        self.peak = 0
+
+    def __enter__(self) -> "Timer":
+        if _profile_prefixes and self.name.startswith(_profile_prefixes):
+            import cProfile
+
+            profile = _profiles.setdefault(self.name, cProfile.Profile())
+            try:
+                profile.enable()
+                self.profile = profile
+            except ValueError:
+                # Another profiler is already active, e.g. that of an enclosing stage
+                pass
+        if _memory_prefixes and self.name.startswith(_memory_prefixes):
+            import tracemalloc
+
+            self.memory = not tracemalloc.is_tracing()
+            if self.memory:
+                tracemalloc.start()
+            # There is a single peak, so the peak so far of an enclosing stage is
+            # kept before the peak is reset for this stage
+            if _memory_timers:
+                outer = _memory_timers[-1]
+                outer.peak = max(outer.peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            _memory_timers.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        seconds = time.perf_counter() - self.start
+        if self.profile is not None:
+            self.profile.disable()
+        stats = _stages.get(self.name)
+        if stats is None:
+            stats = _stages[self.name] = StageStats()
+        stats.add(seconds, self.items)
+        if self.memory is not None:
+            import tracemalloc
+
+            # The peak since the last reset also covers any nested stages
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            stats.peak_memory = max(stats.peak_memory, self.peak)
+            _memory_timers.remove(self)
+            if self.memory:
+                tracemalloc.stop()
+
+
+class _NullTimer:
+    """Shared no-op stand-in for `Timer`, used while instrumentation is disabled."""
+
+    __slots__ = ()
+
+    # Accepts and ignores updates, like `timer.items += len(chunk)`
+    items = property(lambda self: 0, lambda self, items: None)
+
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name: str, items: int = 1):
+    """Return a context manager that records the duration of the block as one call
+    of stage `name`, processing `items` items. A no-op while disabled.
+
+    e.g:
+
+        with instrument.timer(f"fix_query.{self.name}"):
+            fixed = self.fix_query(query)
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return Timer(name, items)
+
+
+def count(name: str, n: int = 1) -> None:
+    """Add `n` to counter `name`. A no-op while disabled."""
+    if _enabled:
+        _counters[name] += n
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def enable(
+    profile: Iterable[str] = (),
+    trace_memory: Iterable[str] = (),
+    report: Optional[str] = None,
+) -> None:
+    """Start recording timings and counters.
+
+    :param profile: Stage name prefixes to capture with cProfile, defaults to none.
+    :type profile: Iterable[str], optional
+    :param trace_memory: Stage name prefixes to record the peak traced memory of
+        with tracemalloc, defaults to none. Tracing slows down all allocations.
+    :type trace_memory: Iterable[str], optional
+    :param report: Write the JSON report to this path when the process exits, optional.
+    :type report: Optional[str], optional
+    """
+    global _enabled, _profile_prefixes, _memory_prefixes
+    _enabled = True
+    _profile_prefixes = tuple(profile)
+    _memory_prefixes = tuple(trace_memory)
+    if report:
+        atexit.register(write_report, report)
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def reset() -> None:
+    """Drop all recorded timings, counters and profiles."""
+    _stages.clear()
+    _counters.clear()
+    _profiles.clear()
+
+
+def report() -> Dict:
+    """Return the recorded timings per stage and the counters."""
+    return {
+        "stages": {name: stats.to_dict() for name, stats in sorted(_stages.items())},
+        "counters": dict(sorted(_counters.items())),
+    }
+
+
+def write_report(filename: str) -> None:
+    """Write `report` as JSON to `filename`. Profiles are written next to it, as
+    `{filename}.{stage}.prof` files, readable with `pstats`."""
+    data = report()
+    if os.path.dirname(filename):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+    if _profiles:
+        data["profiles"] = {}
+        for name, profile in _profiles.items():
+            data["profiles"][name] = f"{filename}.{name}.prof"
+            profile.dump_stats(data["profiles"][name])
+    with open(filename, "w", encoding="utf8") as f:
+        json.dump(data, f, indent=4)
+
+
+def _prefixes(variable: str) -> Iterable[str]:
+    return [prefix for prefix in os.environ.get(variable, "").split(",") if prefix]
+
+
+if os.environ.get("IRSC_REPORT"):
+    enable(
+        profile=_prefixes("IRSC_PROFILE"),
+        trace_memory=_prefixes("IRSC_TRACEMALLOC"),
+        report=os.environ["IRSC_REPORT"],
+    )
+
+
+__all__ = [
+    "timer",
+    "count",
+    "enable",
+    "disable",
+    "is_enabled",
+    "reset",
+    "report",
+    "write_report",
+]
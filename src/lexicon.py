@@ -0,0 +1,258 @@
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+from typing import Dict, Iterator, Optional, Tuple
+
+# File layout, all integers are little-endian uint32:
+#   header:        MAGIC, VERSION, number of keys `n`, number of candidates `m`,
+#                  number of hash slots `capacity` (since version 2)
+#   key offsets:   n + 1 offsets into the key blob
+#   value offsets: n + 1 offsets into the candidate offsets table
+#   cand offsets:  m + 1 offsets into the candidate blob
+#   hash slots:    `capacity` slots of 1 + the index of a key, or 0 if empty, probed
+#                  linearly from the CRC-32 of the key (since version 2)
+#   key blob:      UTF-8 keys, sorted by their encoded bytes
+#   candidate blob: UTF-8 candidates
+MAGIC = b"IRLX"
+VERSION = 2
+PREFIX = struct.Struct("<4sI")
+HEADERS = {1: struct.Struct("<4sIII"), 2: struct.Struct("<4sIIII")}
+
+
+def lexicon_bytes(parsed: Dict[str, Tuple[str]]) -> bytes:
+    """Return `parsed` in the compiled lexicon format, see `compile_lexicon`."""
+    items = sorted((key.encode("utf8"), value) for key, value in parsed.items())
+
+    key_offsets = [0]
+    value_offsets = [0]
+    candidate_offsets = [0]
+    candidates = []
+    for key, value in items:
+        key_offsets.append(key_offsets[-1] + len(key))
+        for candidate in value:
+            candidate = candidate.encode("utf8")
+            candidates.append(candidate)
+            candidate_offsets.append(candidate_offsets[-1] + len(candidate))
+        value_offsets.append(len(candidates))
+
+    # A power of two of at least twice the number of keys keeps probe sequences short
+    capacity = 1 << max(len(items) * 2 - 1, 1).bit_length()
+    slots = [0] * capacity
+    for i, (key, _) in enumerate(items):
+        slot = zlib.crc32(key) & (capacity - 1)
+        while slots[slot]:
+            slot = (slot + 1) & (capacity - 1)
+        slots[slot] = i + 1
+
+    header = HEADERS[VERSION].pack(
+        MAGIC, VERSION, len(items), len(candidates), capacity
+    )
+    tables = (key_offsets, value_offsets, candidate_offsets, slots)
+    return b"".join(
+        [header]
+        + [struct.pack(f"<{len(table)}I", *table) for table in tables]
+        + [b"".join(key for key, _ in items), b"".join(candidates)]
+    )
+
+
+def compile_lexicon(parsed: Dict[str, Tuple[str]], filename: str) -> None:
+    """Write `parsed` as a compiled lexicon to `filename`, to be read with `Lexicon`.
+
+    :param parsed: Mapping from misspellings to a tuple of potential corrections,
+        e.g. as returned by `parser.parse`.
+    :type parsed: Dict[str, Tuple[str]]
+    :param filename: The output file, e.g. `data/processed/parsed.lex`.
+    :type filename: str
+    """
+    with open(filename, "wb") as f:
+        f.write(lexicon_bytes(parsed))
+
+
+class Lexicon:
+    """Read-only view on a compiled lexicon file, as written by `compile_lexicon`.
+    The file is memory-mapped, so opening it is O(1) and pages are shared
+    between processes. Lookups hash into the table of slots in place, or binary
+    search the sorted keys for lexicons of version 1.
+
+    Mirrors the `dict.get` semantics used by `fix_queries_corpora`:
+
+        lexicon = Lexicon("data/processed/parsed.lex")
+        lexicon.get("abilty", ["abilty"])[0]  # "ability"
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._init_tables()
+
+    def _init_tables(self) -> None:
+        magic, self.version = PREFIX.unpack_from(self.buffer, 0)
+        if magic != MAGIC or self.version not in HEADERS:
+            raise IOError(
+                f"{self.filename!r} is not a compiled lexicon (version {VERSION})."
+            )
+        header = HEADERS[self.version].unpack_from(self.buffer, 0)
+        self.size, n_candidates = header[2:4]
+        self.capacity = header[4] if self.version >= 2 else 0
+
+        start = HEADERS[self.version].size
+        self.key_offsets = self._table(start, self.size + 1)
+        start += 4 * (self.size + 1)
+        self.value_offsets = self._table(start, self.size + 1)
+        start += 4 * (self.size + 1)
+        self.candidate_offsets = self._table(start, n_candidates + 1)
+        start += 4 * (n_candidates + 1)
+        self.slots = self._table(start, self.capacity)
+        self.keys_start = start + 4 * self.capacity
+        self.candidates_start = self.keys_start + self.key_offsets[self.size]
+
+    def _table(self, start: int, length: int):
+        """Return a zero-copy view on the uint32 table at `start`."""
+        view = memoryview(self.buffer)[start : start + 4 * length]
+        if sys.byteorder == "little":
+            return view.cast("I")
+        # The tables are little-endian, so big-endian platforms need a converted copy
+        table = array("I", view)
+        table.byteswap()
+        return table
+
+    def _key(self, i: int) -> bytes:
+        start = self.keys_start + self.key_offsets[i]
+        return bytes(self.buffer[start : self.keys_start + self.key_offsets[i + 1]])
+
+    def _find(self, key: str) -> int:
+        """Return the index of `key`, or -1 if it is not in the lexicon."""
+        key = key.encode("utf8")
+        if self.capacity:
+            mask = self.capacity - 1
+            slot = zlib.crc32(key) & mask
+            while index := self.slots[slot]:
+                if self._key(index - 1) == key:
+                    return index - 1
+                slot = (slot + 1) & mask
+            return -1
+
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.size and self._key(low) == key:
+            return low
+        return -1
+
+    def _value(self, i: int) -> Tuple[str]:
+        offsets = self.candidate_offsets[
+            self.value_offsets[i] : self.value_offsets[i + 1] + 1
+        ]
+        start = self.candidates_start
+        return tuple(
+            str(self.buffer[start + begin : start + end], "utf8")
+            for begin, end in zip(offsets, offsets[1:])
+        )
+
+    def get(self, key: str, default=None) -> Optional[Tuple[str]]:
+        i = self._find(key)
+        if i == -1:
+            return default
+        return self._value(i)
+
+    def __getitem__(self, key: str) -> Tuple[str]:
+        i = self._find(key)
+        if i == -1:
+            raise KeyError(key)
+        return self._value(i)
+
+    def __contains__(self, key: str) -> bool:
+        return self._find(key) != -1
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self.size):
+            yield self._key(i).decode("utf8")
+
+    def items(self) -> Iterator[Tuple[str, Tuple[str]]]:
+        for i in range(self.size):
+            yield self._key(i).decode("utf8"), self._value(i)
+
+    def _release_tables(self) -> None:
+        # Views on the buffer must be released before it can be closed
+        for table in (
+            self.key_offsets,
+            self.value_offsets,
+            self.candidate_offsets,
+            self.slots,
+        ):
+            if isinstance(table, memoryview):
+                table.release()
+
+    def close(self) -> None:
+        self._release_tables()
+        self.buffer.close()
+
+
+class SharedLexicon(Lexicon):
+    """A `Lexicon` in a `multiprocessing.shared_memory` block, for mappings that
+    are not compiled to a file, e.g. the misspellings of a single `data_flag`.
+    The creating process exports the mapping once, after which worker processes
+    `attach` to the block by name in O(1), without copying it. Memory use thus
+    stays flat as the number of workers grows.
+
+    e.g:
+
+        lexicon = SharedLexicon.create(parse(data_flag))
+        # In each worker:
+        worker_lexicon = SharedLexicon.attach(lexicon.name)
+        ...
+        lexicon.unlink()
+    """
+
+    def __init__(self, memory):
+        self.memory = memory
+        self.name = memory.name
+        self.filename = f"shared memory {memory.name!r}"
+        self.buffer = memory.buf
+        self._init_tables()
+
+    @classmethod
+    def create(cls, parsed: Dict[str, Tuple[str]]) -> "SharedLexicon":
+        """Export `parsed` to a new shared memory block."""
+        from multiprocessing.shared_memory import SharedMemory
+
+        data = lexicon_bytes(parsed)
+        memory = SharedMemory(create=True, size=len(data))
+        memory.buf[: len(data)] = data
+        return cls(memory)
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedLexicon":
+        """Attach to the shared memory block `name`, as created by `create`.
+        Worker processes of `multiprocessing` share the resource tracker of the
+        creating process, so the block is only removed by `unlink`."""
+        from multiprocessing.shared_memory import SharedMemory
+
+        try:
+            memory = SharedMemory(name, track=False)
+        except TypeError:
+            # `track` was added in Python 3.13
+            memory = SharedMemory(name)
+        return cls(memory)
+
+    def close(self) -> None:
+        self._release_tables()
+        self.memory.close()
+
+    def unlink(self) -> None:
+        """Close and remove the shared memory block. Call once, from the creating process."""
+        self.close()
+        self.memory.unlink()
+
+
+__all__ = ["Lexicon", "SharedLexicon", "compile_lexicon", "lexicon_bytes"]
@@ -1,7 +1,10 @@
 import json
+import os
 import re
 from collections import defaultdict
-from typing import DefaultDict, Dict, List, Set, Tuple
+from typing import DefaultDict, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from . import instrument
 
 ASPELL = 1
 HOLBROOK = 2
@@ -15,10 +18,9 @@ class Parser:
     and then calls `parse_corrects` and `parse_wrongs` on
     the "correct" and "wrong" groups that must be present
     in `pattern`. Fills out the mapping from misspellings
-    to potential correct values.
+    to potential correct values. Multi-token entries are
+    normalized to use a single " " between tokens, see `normalize`.
     Designed to be overridden by subclasses.
-
-    TODO: Handle "_" vs " " to represent spaces
     """
 
     def __init__(self, filename: str, pattern: re.Pattern):
@@ -44,6 +46,45 @@ class Parser:
         """
         return [wrongs]
 
+    def normalize(self, phrase: str) -> str:
+        """Return `phrase` with "_" and runs of whitespace as a single " ".
+        The corpora use either to separate the tokens of multi-token entries,
+        e.g. "a_lot" and "a lot".
+        """
+        return " ".join(phrase.replace("_", " ").split())
+
+    def iter_matches(self, lines: Iterable[str]) -> Iterator[Tuple[str, str]]:
+        """Yield the "correct" and "wrong" groups of each match of `self.pattern`,
+        applied on each line of `lines` separately.
+        Designed to be overridden by subclasses whose entries span multiple lines.
+        """
+        for line in lines:
+            for match in self.pattern.finditer(line):
+                yield match.group("correct"), match.group("wrong")
+
+    def stream(
+        self, lines: Optional[Iterable[str]] = None
+    ) -> Iterator[Tuple[str, str]]:
+        """Lazily yield `(wrong, correct)` pairs from `lines`, or from reading
+        `self.filename` line by line. Memory use does not grow with the input size.
+
+        :param lines: Lines to parse, e.g. an open file. Defaults to reading `self.filename`.
+        :type lines: Optional[Iterable[str]], optional
+        :rtype: Iterator[Tuple[str, str]]
+        """
+        if lines is None:
+            with open(self.filename, "r", encoding="utf8") as f:
+                yield from self.stream(f)
+            return
+
+        for corrects, wrongs in self.iter_matches(lines):
+            corrects = self.parse_corrects(corrects)
+            wrongs = self.parse_wrongs(wrongs)
+            for correct in corrects:
+                correct = self.normalize(correct)
+                for wrong in wrongs:
+                    yield self.normalize(wrong), correct
+
     def parse(self) -> DefaultDict[str, Set[str]]:
         """Iteratively apply `self.pattern` on data from
         `self.filename`. Return a mapping from misspellings
@@ -54,13 +95,10 @@ class Parser:
         if self.parsed:
             return self.parsed
 
-        with open(self.filename, "r", encoding="utf8") as f:
-            for match in self.pattern.finditer(f.read()):
-                corrects = self.parse_corrects(match.group("correct"))
-                wrongs = self.parse_wrongs(match.group("wrong"))
-                for correct in corrects:
-                    for wrong in wrongs:
-                        self.add_misspelling(correct, wrong)
+        with instrument.timer(f"parse.{os.path.basename(self.filename)}") as timer:
+            for wrong, correct in self.stream():
+                self.add_misspelling(correct, wrong)
+            timer.items = len(self.parsed)
         return self.parsed
 
 
@@ -101,6 +139,23 @@ class DollarParser(Parser):
         pattern = re.compile(r"\$(?P<correct>[^\n]*)\n(?P<wrong>[^\$]*)")
         super().__init__(filename, pattern)
 
+    def iter_matches(self, lines: Iterable[str]) -> Iterator[Tuple[str, str]]:
+        """Yield a "correct" and "wrong" group per $-block, where the
+        "wrong" group holds all lines up to the next line starting with "$".
+        """
+        correct = None
+        wrongs = []
+        for line in lines:
+            if line.startswith("$"):
+                if correct is not None:
+                    yield correct, "".join(wrongs)
+                correct = line[1:].rstrip("\n")
+                wrongs = []
+            elif correct is not None:
+                wrongs.append(line)
+        if correct is not None:
+            yield correct, "".join(wrongs)
+
     def parse_wrongs(self, wrongs: str) -> List[str]:
         return [wrong for wrong in wrongs.split("\n") if wrong]
 
@@ -143,13 +198,98 @@ def merge(d1: DefaultDict[str, Set[str]], d2: DefaultDict[str, Set[str]]):
         d1[key] |= value
 
 
+def load_filter() -> Set[str]:
+    """Return the set of manually filtered misspellings from `data/raw/filter.dat`."""
+    with open(r"data/raw/filter.dat", "r", encoding="utf8") as f:
+        return {line.strip() for line in f}
+
+
+def is_filtered(wrong: str, filtered: Set[str]) -> bool:
+    """Return whether the misspelling `wrong` is filtered by `filtered`, as returned by
+    `load_filter`. Multi-token misspellings are also filtered if each of their tokens
+    is in `filtered`, e.g. "a belt" or "may be", as they are valid English and
+    rewriting them would over-correct ordinary queries.
+    """
+    if wrong in filtered:
+        return True
+    tokens = wrong.split()
+    return len(tokens) > 1 and all(token.lower() in filtered for token in tokens)
+
+
+class CorpusIndex:
+    """Combined index over all misspelling corpora, built once.
+    Each misspelling maps to a bitmask of the corpora that contain it
+    (e.g. `HOLBROOK + WIKIPEDIA`), and to its candidates per corpus.
+    The result of `parse(data_flag)` for any `data_flag` is then a
+    cheap projection of this index, see `view`.
+    """
+
+    CORPORA = [
+        (WIKIPEDIA, WIKIPEDIA_PARSER),
+        (BIRKBECK, BIRKBECK_PARSER),
+        (HOLBROOK, HOLBROOK_PARSER),
+        (ASPELL, ASPELL_PARSER),
+    ]
+
+    def __init__(self, apply_filter: bool = True):
+        self.masks: Dict[str, int] = {}
+        self.candidates: Dict[str, Dict[int, Tuple[str]]] = {}
+        for flag, parser in self.CORPORA:
+            for wrong, corrects in parser.parse().items():
+                if not corrects:
+                    continue
+                self.masks[wrong] = self.masks.get(wrong, 0) | flag
+                self.candidates.setdefault(wrong, {})[flag] = tuple(sorted(corrects))
+
+        if apply_filter:
+            filtered = load_filter()
+            for wrong in [
+                wrong for wrong in self.masks if is_filtered(wrong, filtered)
+            ]:
+                del self.masks[wrong]
+                del self.candidates[wrong]
+
+    def view(self, data_flag: int) -> Dict[str, Tuple[str]]:
+        """Return the mapping from misspellings to a tuple of potential corrections,
+        using only the corpora in `data_flag`. Equivalent to `parse(data_flag)`.
+
+        :param data_flag: An integer indicating which datasets to use,
+            e.g. `HOLBROOK + WIKIPEDIA` gives 10.
+        :type data_flag: int
+        :rtype: Dict[str, Tuple[str]]
+        """
+        view = {}
+        for wrong, mask in self.masks.items():
+            mask &= data_flag
+            if not mask:
+                continue
+            candidates = self.candidates[wrong]
+            if mask in candidates:
+                # Only one of the selected corpora contains this misspelling
+                view[wrong] = candidates[mask]
+            else:
+                view[wrong] = tuple(
+                    sorted(
+                        set().union(
+                            *(
+                                value
+                                for flag, value in candidates.items()
+                                if flag & mask
+                            )
+                        )
+                    )
+                )
+        return view
+
+
 def parse(
     data_flag: int,
     write: bool = False,
     verbose: bool = False,
     apply_filter: bool = True,
 ) -> Dict[str, Tuple[str]]:
-    """Parse a set of the raw data, and optionally write to `processed/parsed.json`.
+    """Parse a set of the raw data, and optionally write to `processed/parsed.json`
+    and its compiled, memory-mappable counterpart `processed/parsed.lex`.
 
     :param data_flag: An integer indicating which datasets to use,
         e.g. `HOLBROOK + WIKIPEDIA` gives 10.
@@ -208,20 +348,23 @@ def parse(
     }
 
     if apply_filter:
-        with open(r"data/raw/filter.dat", "r", encoding="utf8") as f:
-            for line in f.readlines():
-                line = line.strip()
-                if line in parsed_combined:
-                    del parsed_combined[line]
-            if verbose:
-                print(
-                    "Removed filtered data: "
-                    f"Corpus now contains {len(parsed_combined)} misspellings."
-                )
+        filtered = load_filter()
+        for wrong in [
+            wrong for wrong in parsed_combined if is_filtered(wrong, filtered)
+        ]:
+            del parsed_combined[wrong]
+        if verbose:
+            print(
+                "Removed filtered data: "
+                f"Corpus now contains {len(parsed_combined)} misspellings."
+            )
 
     if write:
+        from .lexicon import compile_lexicon
+
         with open(r"data/processed/parsed.json", "w", encoding="utf8") as f:
             json.dump(parsed_combined, f, indent=4)
+        compile_lexicon(parsed_combined, r"data/processed/parsed.lex")
 
     return parsed_combined
 
@@ -229,7 +372,8 @@ def parse(
 def parse_all(
     write: bool = False, verbose: bool = False, apply_filter: bool = True
 ) -> Dict[str, Tuple[str]]:
-    """Parse all raw data, and optionally write to `processed/parsed.json`.
+    """Parse all raw data, and optionally write to `processed/parsed.json`
+    and `processed/parsed.lex`.
 
     :param write: Whether to write output to `processed/parsed.json`, defaults to False
     :type write: bool, optional
@@ -263,10 +407,8 @@ def all_combinations(apply_filter: bool = True) -> Dict[int, Dict[str, Tuple[str
         to a tuple of potential corrections. For all possible combinations of misspelling corpora.
     :rtype: Dict[int, Dict[str, Tuple[str]]]
     """
-    return {
-        i: parse(i, write=False, verbose=False, apply_filter=apply_filter)
-        for i in range(1, 16)
-    }
+    index = CorpusIndex(apply_filter=apply_filter)
+    return {i: index.view(i) for i in range(1, 16)}
 
 
 if __name__ == "__main__":
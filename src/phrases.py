@@ -0,0 +1,102 @@
+from typing import Callable, Dict, List, Set, Tuple
+
+# Key of the fix in a node of the trie, which can not collide with a token
+_FIX = None
+
+
+class PhraseMatcher:
+    """Token-level automaton over the multi-token misspellings in `fixes`, a
+    mapping from misspellings to their fix, e.g. "a bout" -> "about". Single-token
+    misspellings are ignored, and left to a plain lookup, see `rewrite`.
+
+    The automaton is a trie over tokens, where each node maps the next token
+    to its child node, and the node ending a phrase holds its fix. Queries are
+    rewritten in one left-to-right scan: at each position the longest phrase
+    is replaced, and otherwise the single token is fixed.
+
+    e.g:
+
+        phrases = PhraseMatcher({"a bout": "about", "a bout time": "about time"})
+        fixes = {"tme": "time"}
+        phrases.rewrite("a bout tme".split(), lambda token: fixes.get(token, token))
+        # ["about", "time"]
+    """
+
+    def __init__(self, fixes: Dict[str, str]):
+        self.root: Dict[str, Dict] = {}
+        # The second tokens of all phrases, which are rarely common words
+        self.seconds: Set[str] = set()
+        self.size = 0
+        self.max_tokens = 0
+        for phrase, fix in fixes.items():
+            tokens = phrase.split()
+            if len(tokens) < 2:
+                continue
+            self.seconds.add(tokens[1])
+            node = self.root
+            for token in tokens:
+                node = node.setdefault(token, {})
+            if _FIX not in node:
+                self.size += 1
+            node[_FIX] = fix
+            self.max_tokens = max(self.max_tokens, len(tokens))
+
+    @classmethod
+    def from_misspellings(cls, parsed_errors: Dict[str, Tuple[str]]) -> "PhraseMatcher":
+        """Compile the multi-token entries of `parsed_errors`, a mapping from
+        misspellings to a tuple of potential fixes, fixing each to its first fix.
+        """
+        return cls(
+            {
+                wrong: corrects[0]
+                for wrong, corrects in parsed_errors.items()
+                if " " in wrong
+            }
+        )
+
+    def __len__(self) -> int:
+        return self.size
+
+    def may_match(self, tokens: List[str]) -> bool:
+        """Return whether `tokens` may contain a phrase, a cheap check that rules
+        out most queries, and all queries of a single token.
+        """
+        return (
+            len(tokens) > 1
+            and not self.seconds.isdisjoint(tokens)
+            and not self.root.keys().isdisjoint(tokens)
+        )
+
+    def rewrite(self, tokens: List[str], fix_token: Callable[[str], str]) -> List[str]:
+        """Return `tokens` with the leftmost-longest, non-overlapping phrases
+        replaced by their fix, and each remaining token replaced by
+        `fix_token(token)`, in a single left-to-right scan. Queries that can not
+        contain a phrase, such as those of a single token, cost one call of
+        `fix_token` per token.
+        """
+        if not self.may_match(tokens):
+            return list(map(fix_token, tokens))
+
+        root = self.root
+        n = len(tokens)
+        fixed = []
+        i = 0
+        while i < n:
+            node = root.get(tokens[i])
+            match = None
+            j = i + 1
+            while node is not None and j < n:
+                node = node.get(tokens[j])
+                j += 1
+                if node is not None and _FIX in node:
+                    match = j, node[_FIX]
+            if match is None:
+                fixed.append(fix_token(tokens[i]))
+                i += 1
+            else:
+                fixed.append(match[1])
+                i = match[0]
+        return fixed
+
+
+__all__ = ["PhraseMatcher"]
@@ -1,50 +1,454 @@
+import argparse
 import csv
-from typing import Dict, List, Tuple
+import gzip
+import os
+import sys
+from collections import deque
+from contextlib import nullcontext
+from functools import lru_cache
+from itertools import islice
+from multiprocessing import Pool
+from typing import (
+    Callable,
+    ContextManager,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TextIO,
+    Tuple,
+)
 
-from .autocorrect import AutoCorrectI, BertCorrecter, Autocorrect
+from . import instrument
+from .autocorrect import AutoCorrectI, get_correcter, release_correcter
+from .cache import CorrectionCache
+from .checkpoint import CheckpointedWriter, QueryWriter
+from .lexicon import SharedLexicon
 
-from .parser import all_combinations
+from .parser import all_combinations, parse
+from .phrases import PhraseMatcher
+
+# Rows of (query ID, query string), e.g. as yielded by `read_queries`
+Queries = Iterable[Tuple[str, str]]
+
+BUFFER_SIZE = 1 << 20
+
+
+def open_queries(filename: str, mode: str = "r") -> ContextManager[TextIO]:
+    """Open a query file for reading or writing. "-" refers to stdin or stdout,
+    and filenames ending with ".gz" are transparently (de)compressed.
+    """
+    if filename == "-":
+        return nullcontext(sys.stdin if "r" in mode else sys.stdout)
+    if filename.endswith(".gz"):
+        return gzip.open(filename, mode + "t", encoding="utf8")
+    return open(filename, mode, encoding="utf8", buffering=BUFFER_SIZE)
+
+
+def read_queries(filename: str) -> Iterator[Tuple[str, str]]:
+    """Lazily yield `(qid, query)` rows from the tab-separated `filename`,
+    see `open_queries`. Memory use does not grow with the file size.
+    """
+    with open_queries(filename) as f:
+        for qid, query in csv.reader(f, delimiter="\t"):
+            yield qid, query
+
+
+def open_fixed_queries(output: str, checkpoint_every: int = 10_000) -> QueryWriter:
+    """Return a writer for fixed queries to `output`. Regular files are written
+    through a resumable `CheckpointedWriter`, while stdout ("-") and gzip
+    outputs are streamed without checkpoints.
+    """
+    if output == "-" or output.endswith(".gz"):
+        return QueryWriter(open_queries(output, "w"))
+    return CheckpointedWriter(output, checkpoint_every=checkpoint_every)
+
+
+def chunked(queries: Iterable, chunk_size: int) -> Iterator[List]:
+    """Yield lists of at most `chunk_size` consecutive elements of `queries`."""
+    queries = iter(queries)
+    while chunk := list(islice(queries, chunk_size)):
+        yield chunk
+
+
+def fix_query_corpora(
+    query: str,
+    parsed_errors: Dict[str, Tuple[str]],
+    phrases: Optional[PhraseMatcher] = None,
+) -> str:
+    """Replace each token in `query` by its first fix in `parsed_errors`, if any.
+    With `phrases`, multi-token misspellings are replaced first, longest match first.
+    """
+    tokens = query.split()
+    if phrases is None or len(tokens) < 2:
+        return " ".join(parsed_errors.get(token, [token])[0] for token in tokens)
+    return " ".join(
+        phrases.rewrite(tokens, lambda token: parsed_errors.get(token, [token])[0])
+    )
 
 
 def fix_queries_corpora(
-    data_flag: int, queries: List[str], parsed_errors: Dict[str, Tuple[str]]
+    data_flag: int,
+    queries: Queries,
+    parsed_errors: Dict[str, Tuple[str]],
+    output: Optional[str] = None,
 ):
-    """Update `queries` according to `parsed_errors` misspellings
+    """Update `queries` according to `parsed_errors` misspellings, including
+    those of multiple tokens, e.g. "a bout" -> "about".
 
     :param data_flag: The data flag as used in the parser.
         e.g. `HOLBROOK + WIKIPEDIA` gives 10.
     :type data_flag: int
-    :param queries: List of query strings, starting with a query ID.
-    :type queries: List[str]
+    :param queries: Iterable of (query ID, query string) rows.
+    :type queries: Queries
     :param parsed_errors: Dictionary of typo to tuple of potential fixes.
     :type parsed_errors: Dict[str, Tuple[str]]
+    :param output: The output file, or "-" for stdout.
+        Defaults to `data/queries/{data_flag}_fixed_queries.tsv`.
+    :type output: Optional[str], optional
+    """
+    output = output or rf"data/queries/{data_flag}_fixed_queries.tsv"
+    phrases = PhraseMatcher.from_misspellings(parsed_errors)
+    with instrument.timer(f"fix_queries_corpora.{data_flag}", 0) as timer:
+        with open_queries(output, "w") as fixed_queries:
+            for chunk in chunked(queries, 8192):
+                fixed_queries.writelines(
+                    f"{qid}\t{fix_query_corpora(query, parsed_errors, phrases)}\n"
+                    for qid, query in chunk
+                )
+                timer.items += len(chunk)
+
+
+def fix_queries_corpora_all(
+    queries: Queries, parsed_errors_dict: Dict[int, Dict[str, Tuple[str]]]
+):
+    """Update `queries` according to the misspellings of every `data_flag`
+    in `parsed_errors_dict`, in a single pass over `queries`. Each token is
+    looked up once, in a mapping from a misspelling to its fix per `data_flag`.
+    Only queries that may contain a multi-token misspelling are rewritten
+    per `data_flag`.
+
+    :param queries: Iterable of (query ID, query string) rows.
+    :type queries: Queries
+    :param parsed_errors_dict: Mapping of `data_flag` to a dictionary of typo
+        to tuple of potential fixes, e.g. as returned by `all_combinations`.
+    :type parsed_errors_dict: Dict[int, Dict[str, Tuple[str]]]
+    """
+    data_flags = list(parsed_errors_dict)
+    phrases = {
+        data_flag: PhraseMatcher.from_misspellings(parsed_errors)
+        for data_flag, parsed_errors in parsed_errors_dict.items()
+    }
+    # The multi-token misspellings of any `data_flag`, to rule out most queries at once
+    any_phrases = PhraseMatcher(
+        {
+            wrong: wrong
+            for parsed_errors in parsed_errors_dict.values()
+            for wrong in parsed_errors
+            if " " in wrong
+        }
+    )
+    fixes_per_flag = {}
+    for parsed_errors in parsed_errors_dict.values():
+        for token in parsed_errors:
+            if token not in fixes_per_flag:
+                fixes_per_flag[token] = tuple(
+                    parsed_errors_dict[data_flag].get(token, [token])[0]
+                    for data_flag in data_flags
+                )
+
+    files = [
+        open_queries(rf"data/queries/{data_flag}_fixed_queries.tsv", "w")
+        for data_flag in data_flags
+    ]
+    rows = 0
+    with instrument.timer("fix_queries_corpora_all") as timer:
+        try:
+            for qid, query in queries:
+                rows += 1
+                tokens = query.split()
+                if any_phrases.may_match(tokens):
+                    # Rare queries that may contain a multi-token misspelling
+                    for data_flag, fixed_queries in zip(data_flags, files):
+                        fixed_query = fix_query_corpora(
+                            query, parsed_errors_dict[data_flag], phrases[data_flag]
+                        )
+                        fixed_queries.write(f"{qid}\t{fixed_query}\n")
+                    continue
+
+                fixes = [fixes_per_flag.get(token) for token in tokens]
+                if not any(fixes):
+                    line = f"{qid}\t{' '.join(tokens)}\n"
+                    for fixed_queries in files:
+                        fixed_queries.write(line)
+                    continue
+
+                for i, fixed_queries in enumerate(files):
+                    fixed_query = " ".join(
+                        token if fix is None else fix[i]
+                        for token, fix in zip(tokens, fixes)
+                    )
+                    fixed_queries.write(f"{qid}\t{fixed_query}\n")
+        finally:
+            for fixed_queries in files:
+                fixed_queries.close()
+            timer.items = rows
+
+
+def fix_queries_autocorrect(
+    autocorrecter: AutoCorrectI,
+    queries: Queries,
+    batch_size: int = 32,
+    chunk_size: int = 4096,
+    output: Optional[str] = None,
+    checkpoint_every: int = 10_000,
+):
+    """Update `queries` using `autocorrecter`, in batches. The run is
+    checkpointed, so if it is interrupted, rerunning it with the same
+    arguments continues after the last checkpoint.
+
+    :param autocorrecter: The correcter to apply on each query.
+    :type autocorrecter: AutoCorrectI
+    :param queries: Iterable of (query ID, query string) rows.
+    :type queries: Queries
+    :param batch_size: The number of queries per `correct_batch` call, defaults to 32
+    :type batch_size: int, optional
+    :param chunk_size: The number of queries handed to the correcter at once.
+        Larger chunks allow for better length bucketing. defaults to 4096
+    :type chunk_size: int, optional
+    :param output: The output file, or "-" for stdout. Defaults to
+        `data/queries/{correcter name}_fixed_queries.tsv`.
+    :type output: Optional[str], optional
+    :param checkpoint_every: The number of queries between checkpoints, defaults to 10_000
+    :type checkpoint_every: int, optional
+    """
+    output = output or rf"data/queries/{autocorrecter.name}_fixed_queries.tsv"
+    with open_fixed_queries(output, checkpoint_every) as writer:
+        for chunk in chunked(writer.skip(queries), chunk_size):
+            fixed = autocorrecter.fix_queries(
+                [query for _, query in chunk], batch_size=batch_size
+            )
+            with instrument.timer(f"write.{autocorrecter.name}", len(chunk)):
+                writer.write(chunk, fixed)
+
+
+# State of a worker process, set once by the pool initializers below.
+_worker_correcter: Optional[AutoCorrectI] = None
+_worker_batch_size: int = 32
+_worker_fix_token: Optional[Callable[[str], str]] = None
+_worker_phrases: Optional[PhraseMatcher] = None
+
+
+def _limit_threads(threads: int) -> None:
+    """Restrict the number of threads torch and BLAS may use in this process."""
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[variable] = str(threads)
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def _init_correcter_worker(name: str, threads: int, batch_size: int) -> None:
+    global _worker_correcter, _worker_batch_size
+    _limit_threads(threads)
+    _worker_correcter = get_correcter(name)
+    _worker_batch_size = batch_size
+
+
+def _init_corpora_worker(name: str, cache_size: int, phrases: PhraseMatcher) -> None:
+    global _worker_fix_token, _worker_phrases
+    _worker_phrases = phrases
+    lexicon = SharedLexicon.attach(name)
+    # Frequent tokens are served from a per-worker cache instead of the shared lexicon
+    _worker_fix_token = lru_cache(maxsize=cache_size)(
+        lambda token: lexicon.get(token, (token,))[0]
+    )
+
+
+def _fix_chunk_correcter(queries: List[str]) -> List[str]:
+    return _worker_correcter.fix_queries(queries, batch_size=_worker_batch_size)
+
+
+def _fix_chunk_corpora(queries: List[str]) -> List[str]:
+    return [
+        " ".join(_worker_phrases.rewrite(query.split(), _worker_fix_token))
+        for query in queries
+    ]
+
+
+def _write_parallel(
+    pool: Pool, function, chunks: Iterable[List], writer: QueryWriter, window: int
+):
+    """Write the results of `function` on the query strings of each chunk in
+    `chunks` to `writer`, keeping the original order. At most `window` chunks
+    are in flight at once, so memory use does not grow with the number of queries.
+    """
+    pending = deque()
+    with writer:
+        for chunk in chunks:
+            task = [query for _, query in chunk]
+            pending.append((chunk, pool.apply_async(function, (task,))))
+            if len(pending) >= window:
+                chunk, result = pending.popleft()
+                writer.write(chunk, result.get())
+        while pending:
+            chunk, result = pending.popleft()
+            writer.write(chunk, result.get())
+
+
+def fix_queries_autocorrect_parallel(
+    name: str,
+    queries: Queries,
+    processes: Optional[int] = None,
+    batch_size: int = 32,
+    chunk_size: int = 1024,
+    output: Optional[str] = None,
+    checkpoint_every: int = 10_000,
+):
+    """Update `queries` using the correcter registered as `name`, sharded
+    over `processes` worker processes. Each worker builds the correcter once,
+    and the output keeps the order of `queries`. Like `fix_queries_autocorrect`,
+    the run is checkpointed and can be resumed.
+
+    :param name: The registered name of the correcter, e.g. "autocorrect".
+    :type name: str
+    :param queries: Iterable of (query ID, query string) rows.
+    :type queries: Queries
+    :param processes: The number of worker processes, defaults to the number of CPUs.
+    :type processes: Optional[int], optional
+    :param batch_size: The number of queries per `correct_batch` call, defaults to 32
+    :type batch_size: int, optional
+    :param chunk_size: The number of queries sent to a worker at once, defaults to 1024
+    :type chunk_size: int, optional
+    :param output: The output file, or "-" for stdout. Defaults to
+        `data/queries/{name}_fixed_queries.tsv`.
+    :type output: Optional[str], optional
+    :param checkpoint_every: The number of queries between checkpoints, defaults to 10_000
+    :type checkpoint_every: int, optional
     """
-    with open(
-        rf"data/queries/{data_flag}_fixed_queries.tsv", "w", encoding="utf8"
-    ) as fixed_queries:
-        for qid, query in queries:
-            query = query.split()
-            query = [parsed_errors.get(token, [token])[0] for token in query]
-            fixed_queries.write(f"{qid}\t{' '.join(query)}\n")
-
-
-def fix_queries_autocorrect(autocorrecter: AutoCorrectI, queries: List[str]):
-    with open(
-        rf"data/queries/{autocorrecter.__class__.__name__.lower()}_fixed_queries.tsv",
-        "a",
-        encoding="utf8",
-    ) as fixed_queries:
-        for qid, query in queries:
-            fixed_query = autocorrecter.fix_query(query)
-            fixed_queries.write(f"{qid}\t{fixed_query}\n")
+    processes = processes or os.cpu_count()
+    threads = max(1, os.cpu_count() // processes)
+    output = output or rf"data/queries/{name}_fixed_queries.tsv"
+    writer = open_fixed_queries(output, checkpoint_every)
+    with Pool(processes, _init_correcter_worker, (name, threads, batch_size)) as pool:
+        _write_parallel(
+            pool,
+            _fix_chunk_correcter,
+            chunked(writer.skip(queries), chunk_size),
+            writer,
+            window=2 * processes,
+        )
+
+
+def fix_queries_corpora_parallel(
+    data_flag: int,
+    queries: Queries,
+    processes: Optional[int] = None,
+    chunk_size: int = 8192,
+    cache_size: int = 2**16,
+    output: Optional[str] = None,
+):
+    """Update `queries` according to the misspellings of `data_flag`,
+    sharded over `processes` worker processes. The corpora are parsed once,
+    into a shared memory block that each worker attaches to without copying it,
+    so memory use does not grow with `processes`. The output keeps the order of
+    `queries`.
+
+    :param data_flag: The data flag as used in the parser.
+        e.g. `HOLBROOK + WIKIPEDIA` gives 10.
+    :type data_flag: int
+    :param queries: Iterable of (query ID, query string) rows.
+    :type queries: Queries
+    :param processes: The number of worker processes, defaults to the number of CPUs.
+    :type processes: Optional[int], optional
+    :param chunk_size: The number of queries sent to a worker at once, defaults to 8192
+    :type chunk_size: int, optional
+    :param cache_size: The number of token fixes each worker caches, defaults to 2**16
+    :type cache_size: int, optional
+    :param output: The output file, or "-" for stdout.
+        Defaults to `data/queries/{data_flag}_fixed_queries.tsv`.
+    :type output: Optional[str], optional
+    """
+    output = output or rf"data/queries/{data_flag}_fixed_queries.tsv"
+    processes = processes or os.cpu_count()
+    parsed_errors = parse(data_flag)
+    # The phrases are few, so each worker gets a copy of their automaton
+    phrases = PhraseMatcher.from_misspellings(parsed_errors)
+    lexicon = SharedLexicon.create(parsed_errors)
+    try:
+        with Pool(
+            processes, _init_corpora_worker, (lexicon.name, cache_size, phrases)
+        ) as pool:
+            _write_parallel(
+                pool,
+                _fix_chunk_corpora,
+                chunked(queries, chunk_size),
+                QueryWriter(open_queries(output, "w")),
+                window=2 * processes,
+            )
+    finally:
+        lexicon.unlink()
+
 
 if __name__ == "__main__":
-    with open(r"data/queries/docv2_train_queries.tsv", "r", encoding="utf8") as f:
-        queries = list(csv.reader(f, delimiter="\t"))
+    parser = argparse.ArgumentParser(
+        description="Correct queries with a single correcter, streamed from a file, a "
+        ".gz file or stdin, or run all experiments if no correcter is given."
+    )
+    parser.add_argument(
+        "--queries",
+        default="data/queries/docv2_train_queries.tsv",
+        help='Tab-separated queries, optionally gzipped, or "-" for stdin.',
+    )
+    parser.add_argument(
+        "--correcter", help='Registered correcter name, e.g. "autocorrect".'
+    )
+    parser.add_argument(
+        "--output",
+        help='Output file, optionally gzipped, or "-" for stdout. Defaults to '
+        "data/queries/{correcter}_fixed_queries.tsv.",
+    )
+    parser.add_argument(
+        "--processes", type=int, help="Correct in this many worker processes."
+    )
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
 
-        parsed_errors_dict = all_combinations()
-        for data_flag, parsed_errors in parsed_errors_dict.items():
-            fix_queries_corpora(data_flag, queries, parsed_errors)
+    if args.correcter is None:
+        # Each experiment reads the queries again, which stdin does not allow
+        if args.queries == "-" or args.output:
+            parser.error("--queries - and --output require --correcter")
+        fix_queries_corpora_all(read_queries(args.queries), all_combinations())
 
-        for autocorrecter in [BertCorrecter(), Autocorrect()]:
-            fix_queries_autocorrect(autocorrecter, queries)
+        cache = CorrectionCache()
+        # The gated run comes first, so that the BERT model it loads is reused by the next
+        for name in ["gatedbertcorrecter", "bertcorrecter", "autocorrect"]:
+            autocorrecter = get_correcter(name)
+            autocorrecter.cache = cache
+            fix_queries_autocorrect(autocorrecter, read_queries(args.queries))
+            if hasattr(autocorrecter, "cache_info"):
+                print(f"{name} token cache: {autocorrecter.cache_info()}")
+            if hasattr(autocorrecter, "skip_rate"):
+                print(f"{name} skipped {autocorrecter.skip_rate():.2%} of queries")
+            release_correcter(name)
+    elif args.processes:
+        fix_queries_autocorrect_parallel(
+            args.correcter,
+            read_queries(args.queries),
+            processes=args.processes,
+            batch_size=args.batch_size,
+            output=args.output,
+        )
+    else:
+        autocorrecter = get_correcter(args.correcter)
+        autocorrecter.cache = CorrectionCache()
+        fix_queries_autocorrect(
+            autocorrecter,
+            read_queries(args.queries),
+            batch_size=args.batch_size,
+            output=args.output,
+        )
@@ -0,0 +1,229 @@
+import argparse
+import glob
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .cache import normalize_query
+from .queries import BUFFER_SIZE, chunked, read_queries
+
+# Ranked (document ID, score) pairs of a single query
+Hits = List[Tuple[str, float]]
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class SearcherI:
+    """Interface of a retrieval backend, searching batches of queries."""
+
+    def search_batch(
+        self, queries: Dict[str, str], k: int = 10, threads: int = 1
+    ) -> Dict[str, Hits]:
+        """Return the top `k` hits for each query in `queries`, a mapping from
+        query ID to query string, keyed by query ID.
+        """
+        raise NotImplementedError()
+
+
+class LuceneSearcher(SearcherI):
+    """BM25 over a Lucene index, using pyserini, like `python -m pyserini.search --bm25`."""
+
+    def __init__(self, index: str, k1: float = 0.9, b: float = 0.4):
+        from pyserini.search.lucene import LuceneSearcher as PyseriniSearcher
+
+        self.searcher = PyseriniSearcher(index)
+        self.searcher.set_bm25(k1, b)
+
+    def search_batch(
+        self, queries: Dict[str, str], k: int = 10, threads: int = 1
+    ) -> Dict[str, Hits]:
+        results = self.searcher.batch_search(
+            list(queries.values()), list(queries), k=k, threads=threads
+        )
+        return {
+            qid: [(hit.docid, hit.score) for hit in hits]
+            for qid, hits in results.items()
+        }
+
+
+class BM25Searcher(SearcherI):
+    """In-memory BM25 over a small collection of documents, as a stand-in for
+    `LuceneSearcher` where no index is available, e.g. in tests. Tokens are
+    lowercased words, without stemming or stopword removal.
+
+    e.g:
+
+        searcher = BM25Searcher({"D1": "spelling correction", "D2": "ranking"})
+        searcher.search_batch({"1": "spelling"})  # {"1": [("D1", 0.65...)]}
+    """
+
+    def __init__(self, documents: Dict[str, str], k1: float = 0.9, b: float = 0.4):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[str, int]]] = {}
+        self.lengths: Dict[str, int] = {}
+        for docid, text in documents.items():
+            tokens = self.tokenize(text)
+            self.lengths[docid] = len(tokens)
+            for token, count in Counter(tokens).items():
+                self.postings.setdefault(token, []).append((docid, count))
+        self.average_length = sum(self.lengths.values()) / max(len(self.lengths), 1)
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        return TOKEN_PATTERN.findall(text.lower())
+
+    def search(self, query: str, k: int = 10) -> Hits:
+        n_documents = len(self.lengths)
+        scores = Counter()
+        for token in set(self.tokenize(query)):
+            postings = self.postings.get(token, [])
+            idf = math.log(
+                1 + (n_documents - len(postings) + 0.5) / (len(postings) + 0.5)
+            )
+            for docid, count in postings:
+                norm = 1 - self.b + self.b * self.lengths[docid] / self.average_length
+                scores[docid] += idf * count * (self.k1 + 1) / (count + self.k1 * norm)
+        # Break ties by document ID, like Lucene
+        return sorted(scores.items(), key=lambda hit: (-hit[1], hit[0]))[:k]
+
+    def search_batch(
+        self, queries: Dict[str, str], k: int = 10, threads: int = 1
+    ) -> Dict[str, Hits]:
+        return {qid: self.search(query, k) for qid, query in queries.items()}
+
+
+def changed_queries(original: str, fixed: str) -> Dict[str, str]:
+    """Return the queries of the `fixed` query file that differ from those with
+    the same query ID in the `original` query file, keyed by query ID. Queries
+    that only differ in whitespace are not changed, see `normalize_query`.
+    """
+    original_queries = {
+        qid: normalize_query(query) for qid, query in read_queries(original)
+    }
+    changed = {}
+    for qid, query in read_queries(fixed):
+        if qid not in original_queries:
+            raise ValueError(f"Unknown qid {qid} in {fixed!r}.")
+        if original_queries[qid] != normalize_query(query):
+            changed[qid] = query
+    return changed
+
+
+def format_hits(qid: str, hits: Hits, tag: str = "Anserini") -> str:
+    """Format the `hits` of query `qid` as TREC run lines, like pyserini."""
+    return "".join(
+        f"{qid} Q0 {docid} {rank} {score:.6f} {tag}\n"
+        for rank, (docid, score) in enumerate(hits, start=1)
+    )
+
+
+def splice_run(baseline: str, hits: Dict[str, Hits], output: str) -> None:
+    """Write the TREC run `baseline` to `output`, replacing the hits of every
+    query in `hits`. The order of the queries in `baseline` is kept, and queries
+    that have no hits in `baseline` are appended at the end.
+
+    :param baseline: The TREC run of the original queries, e.g. `data/output/0_rank.txt`.
+    :type baseline: str
+    :param hits: Mapping of query ID to its new hits.
+    :type hits: Dict[str, Hits]
+    :param output: The spliced TREC run.
+    :type output: str
+    """
+    written = set()
+    with open(baseline, "r", encoding="utf8") as f_in, open(
+        output, "w", encoding="utf8", buffering=BUFFER_SIZE
+    ) as f_out:
+        for line in f_in:
+            qid = line.split(" ", 1)[0]
+            if qid not in hits:
+                f_out.write(line)
+            elif qid not in written:
+                f_out.write(format_hits(qid, hits[qid]))
+                written.add(qid)
+        for qid in hits.keys() - written:
+            f_out.write(format_hits(qid, hits[qid]))
+
+
+def search_incremental(
+    searcher: SearcherI,
+    fixed: str,
+    original: str = "data/queries/docv2_train_queries.tsv",
+    baseline: str = "data/output/0_rank.txt",
+    output: Optional[str] = None,
+    k: int = 10,
+    batch_size: int = 36,
+    threads: int = 1,
+) -> int:
+    """Produce the run of the `fixed` queries by only searching the queries that
+    differ from the `original` queries, and splicing their hits into the
+    `baseline` run of the `original` queries.
+
+    :param searcher: The retrieval backend, which must match the one of `baseline`.
+    :type searcher: SearcherI
+    :param fixed: The fixed query file, e.g. `data/queries/1_fixed_queries.tsv`.
+    :type fixed: str
+    :param original: The original query file, defaults to "data/queries/docv2_train_queries.tsv"
+    :type original: str, optional
+    :param baseline: The TREC run of `original`, defaults to "data/output/0_rank.txt"
+    :type baseline: str, optional
+    :param output: The output TREC run. Defaults to `data/output/{prefix}_rank.txt`,
+        where `prefix` is the part of the `fixed` filename before the first "_".
+    :type output: Optional[str], optional
+    :param k: The number of hits per query, defaults to 10
+    :type k: int, optional
+    :param batch_size: The number of queries per call to the searcher, defaults to 36
+    :type batch_size: int, optional
+    :param threads: The number of search threads, defaults to 1
+    :type threads: int, optional
+    :return: The number of queries that were searched.
+    :rtype: int
+    """
+    prefix = os.path.basename(fixed).split("_")[0]
+    output = output or f"data/output/{prefix}_rank.txt"
+    changed = changed_queries(original, fixed)
+    hits = {}
+    for batch in chunked(changed.items(), batch_size):
+        hits.update(searcher.search_batch(dict(batch), k=k, threads=threads))
+    splice_run(baseline, hits, output)
+    return len(changed)
+
+
+def search_all_incremental(
+    searcher: SearcherI, fixed_files: Iterable[str], **kwargs
+) -> None:
+    """Apply `search_incremental` on every file in `fixed_files`."""
+    for fixed in fixed_files:
+        searched = search_incremental(searcher, fixed, **kwargs)
+        print(f"{fixed}: searched {searched} modified queries.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Search only the queries that a correcter modified, and splice "
+        "their hits into the run of the original queries."
+    )
+    parser.add_argument("--index", required=True, help="Lucene index.")
+    parser.add_argument(
+        "--fixed",
+        default="data/queries/*_fixed_queries.tsv",
+        help="Glob of fixed query files.",
+    )
+    parser.add_argument("--original", default="data/queries/docv2_train_queries.tsv")
+    parser.add_argument("--baseline", default="data/output/0_rank.txt")
+    parser.add_argument("--hits", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=36)
+    parser.add_argument("--threads", type=int, default=12)
+    args = parser.parse_args()
+
+    search_all_incremental(
+        LuceneSearcher(args.index),
+        sorted(glob.glob(args.fixed)),
+        original=args.original,
+        baseline=args.baseline,
+        k=args.hits,
+        batch_size=args.batch_size,
+        threads=args.threads,
+    )
@@ -0,0 +1,251 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, List, Optional, Tuple
+
+from .autocorrect import AutoCorrectI, get_correcter
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Return the `q`-th percentile (0-100) of `values`, using the nearest rank."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+class MicroBatcher:
+    """Collects concurrent correction requests into micro-batches for `correcter`.
+    A batch is sent to the correcter once it holds `max_batch_size` queries, or
+    `max_wait_ms` after its first query arrived. Each request has a latency budget;
+    if the correction is not done in time, the uncorrected query is returned.
+    Inference runs on a single background thread, so the event loop stays responsive.
+    """
+
+    def __init__(
+        self,
+        correcter: AutoCorrectI,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        budget_ms: float = 100.0,
+        window: int = 10_000,
+    ):
+        self.correcter = correcter
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.budget = budget_ms / 1000
+        self.queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+        # Statistics over the last `window` requests
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.batch_sizes: Counter = Counter()
+        self.requests = 0
+        self.fallbacks = 0
+
+    async def start(self) -> None:
+        self.queue = asyncio.Queue()
+        # Keep a reference, so the task is not garbage collected while it runs
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Cancel the batching task started by `start`."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def correct(
+        self, query: str, budget_ms: Optional[float] = None
+    ) -> Tuple[str, bool]:
+        """Return the corrected `query`, and whether the correction finished
+        within the latency budget. Otherwise, `query` itself is returned.
+        """
+        start = time.perf_counter()
+        budget = self.budget if budget_ms is None else budget_ms / 1000
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((query, future, start + budget))
+        try:
+            fixed = await asyncio.wait_for(asyncio.shield(future), budget)
+            corrected = True
+        except Exception:
+            # Missed the deadline, or the correcter failed on this batch
+            fixed, corrected = query, False
+            self.fallbacks += 1
+        self.requests += 1
+        self.latencies.append(time.perf_counter() - start)
+        return fixed, corrected
+
+    async def _collect(self) -> List[Tuple[str, asyncio.Future, float]]:
+        """Wait for a first request, then gather more until the batch is full or
+        `max_wait` has passed."""
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Requests that already fell back to the uncorrected query need no inference
+            now = time.perf_counter()
+            batch = [item for item in batch if item[2] > now and not item[1].done()]
+            if not batch:
+                continue
+            self.batch_sizes[len(batch)] += 1
+            queries = [query for query, _, _ in batch]
+            try:
+                fixed = await loop.run_in_executor(
+                    self.executor, self.correcter.fix_queries, queries, len(queries)
+                )
+            except Exception as exc:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            for (_, future, _), fixed_query in zip(batch, fixed):
+                if not future.done():
+                    future.set_result(fixed_query)
+
+    def stats(self) -> Dict[str, float]:
+        """Return latency percentiles (in ms) and batch size statistics."""
+        latencies = list(self.latencies)
+        batches = sum(self.batch_sizes.values())
+        batched = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            "requests": self.requests,
+            "fallbacks": self.fallbacks,
+            "latency_p50_ms": percentile(latencies, 50) * 1000,
+            "latency_p99_ms": percentile(latencies, 99) * 1000,
+            "batches": batches,
+            "mean_batch_size": batched / max(batches, 1),
+            "max_batch_size": max(self.batch_sizes, default=0),
+        }
+
+
+class CorrectionServer:
+    """Minimal local HTTP/1.1 server in front of a `MicroBatcher`, over TCP or
+    a Unix socket. Uses only the standard library, and needs no network access
+    beyond the local socket.
+
+    Endpoints:
+
+        POST /correct  {"query": "helo world", "budget_ms": 50}
+                    -> {"query": "hello world", "corrected": true}
+        GET  /stats -> latency and batch size statistics
+    """
+
+    def __init__(self, batcher: MicroBatcher):
+        self.batcher = batcher
+
+    async def handle(self, method: str, path: str, body: bytes) -> Tuple[int, Dict]:
+        if method == "GET" and path == "/stats":
+            return 200, self.batcher.stats()
+        if method == "POST" and path == "/correct":
+            try:
+                request = json.loads(body)
+                query = request["query"]
+            except (ValueError, KeyError, TypeError):
+                return 400, {"error": 'Expected a JSON body with a "query" field.'}
+            if not isinstance(query, str):
+                return 400, {"error": 'The "query" field must be a string.'}
+            budget_ms = request.get("budget_ms")
+            if budget_ms is not None and (
+                isinstance(budget_ms, bool)
+                or not isinstance(budget_ms, (int, float))
+                or not 0 < budget_ms < float("inf")
+            ):
+                return 400, {
+                    "error": 'The "budget_ms" field must be a positive number.'
+                }
+            fixed, corrected = await self.batcher.correct(query, budget_ms)
+            return 200, {"query": fixed, "corrected": corrected}
+        return 404, {"error": f"Unknown endpoint {method} {path}."}
+
+    async def _serve_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin1").split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    key, _, value = line.decode("latin1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, response = await self.handle(method, path, body)
+                payload = json.dumps(response).encode("utf8")
+                keep_alive = headers.get("connection", "").lower() != "close"
+                head = (
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                )
+                writer.write(head.encode("latin1") + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(
+        self, host: str = "127.0.0.1", port: int = 8080, unix: Optional[str] = None
+    ) -> None:
+        await self.batcher.start()
+        if unix:
+            server = await asyncio.start_unix_server(self._serve_connection, unix)
+        else:
+            server = await asyncio.start_server(self._serve_connection, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.batcher.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve a correcter locally, with dynamic micro-batching."
+    )
+    parser.add_argument(
+        "--correcter", default="bertcorrecter", help="Registered correcter name."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--unix", help="Serve on this Unix socket path instead of TCP.")
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--budget-ms", type=float, default=100.0)
+    args = parser.parse_args()
+
+    correcter = get_correcter(args.correcter)
+    correcter.warm_up()
+    batcher = MicroBatcher(
+        correcter,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        budget_ms=args.budget_ms,
+    )
+    asyncio.run(CorrectionServer(batcher).serve(args.host, args.port, args.unix))
@@ -0,0 +1,162 @@
+import hashlib
+import os
+import pickle
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set
+
+ENGLISH_WORDS = [
+    "data/raw/english_words/words_subset1.txt",
+    "data/raw/english_words/words_subset2.txt",
+]
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Return the optimal string alignment distance (Levenshtein distance with
+    adjacent transpositions) between `a` and `b`, or `max_distance + 1` if it
+    exceeds `max_distance`.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    # Common prefixes and suffixes do not affect the distance
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while (
+        end < len(a) - start
+        and end < len(b) - start
+        and a[len(a) - end - 1] == b[len(b) - end - 1]
+    ):
+        end += 1
+    a, b = a[start : len(a) - end], b[start : len(b) - end]
+    if not a or not b:
+        return min(len(a) + len(b), max_distance + 1)
+
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(
+                previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost
+            )
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return min(previous[-1], max_distance + 1)
+
+
+def deletes(word: str, max_distance: int) -> Set[str]:
+    """Return all strings that can be made by deleting up to `max_distance`
+    characters from `word`, excluding `word` itself."""
+    found = set()
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {
+            candidate[:i] + candidate[i + 1 :]
+            for candidate in frontier
+            for i in range(len(candidate))
+        } - found
+        found |= frontier
+    found.discard(word)
+    return found
+
+
+class SymSpellIndex:
+    """Symmetric delete index for fast lookups of vocabulary words within
+    `max_distance` edits. Every vocabulary word is indexed under all strings
+    reachable by deleting up to `max_distance` characters from its first
+    `prefix_length` characters. A lookup then only needs the deletes of the
+    query token, rather than all of its possible edits.
+
+    e.g:
+
+        index = SymSpellIndex({"ability": 3, "about": 10})
+        index.lookup("abilty")  # "ability"
+    """
+
+    def __init__(
+        self, counts: Dict[str, int], max_distance: int = 2, prefix_length: int = 7
+    ):
+        self.counts = counts
+        self.digest = vocabulary_digest(counts)
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.deletes: Dict[str, List[str]] = {}
+        for word in counts:
+            prefix = word[:prefix_length]
+            for key in deletes(prefix, max_distance) | {prefix}:
+                self.deletes.setdefault(key, []).append(word)
+
+    def lookup(self, token: str) -> Optional[str]:
+        """Return the vocabulary word closest to `token`, preferring words with
+        higher counts and then alphabetical order. Returns `token` itself if it is
+        in the vocabulary, or None if no word lies within `max_distance` edits.
+        """
+        if token in self.counts:
+            return token
+
+        prefix = token[: self.prefix_length]
+        candidates = set()
+        for key in deletes(prefix, self.max_distance) | {prefix}:
+            candidates.update(self.deletes.get(key, ()))
+
+        # Verify the candidates, only allowing distances up to the best so far
+        best, best_key = None, None
+        bound = self.max_distance
+        for word in candidates:
+            if abs(len(word) - len(token)) > bound:
+                continue
+            distance = edit_distance(token, word, bound)
+            if distance > bound:
+                continue
+            candidate_key = (distance, -self.counts[word], word)
+            if best_key is None or candidate_key < best_key:
+                best, best_key, bound = word, candidate_key, distance
+        return best
+
+    def save(self, filename: str) -> None:
+        if os.path.dirname(filename):
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(filename: str) -> "SymSpellIndex":
+        with open(filename, "rb") as f:
+            return pickle.load(f)
+
+
+def vocabulary_digest(counts: Dict[str, int]) -> str:
+    """Return a hash of the words and counts in `counts`, independent of their order,
+    to detect indices built from an outdated vocabulary."""
+    digest = hashlib.sha256()
+    for word, count in sorted(counts.items()):
+        digest.update(f"{word}\t{count}\n".encode("utf8"))
+    return digest.hexdigest()
+
+
+def vocabulary_counts(
+    word_files: Iterable[str] = ENGLISH_WORDS,
+    parsed_errors: Optional[Dict[str, Iterable[str]]] = None,
+) -> Dict[str, int]:
+    """Return a mapping from lowercase vocabulary words to a count, for all words in
+    `word_files` and all single-word corrections in `parsed_errors`. The count is
+    the number of word files containing the word, plus the number of misspellings
+    that it is a correction for.
+    """
+    counts = Counter()
+    for filename in word_files:
+        with open(filename, "r", encoding="utf8") as f:
+            counts.update(word.strip().lower() for word in f if word.strip())
+    for corrects in (parsed_errors or {}).values():
+        counts.update(
+            correct.lower() for correct in corrects if correct and " " not in correct
+        )
+    return dict(counts)
+
+
+__all__ = ["SymSpellIndex", "edit_distance", "vocabulary_counts", "vocabulary_digest"]
@@ -0,0 +1,6 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# `src` is imported as a package, and the scripts in `tools` as top-level modules
+sys.path[:0] = [ROOT, os.path.join(ROOT, "tools")]
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from src.checkpoint import CheckpointedWriter
+from src.queries import chunked
+
+QUERIES = [(str(qid), f"query {qid}") for qid in range(100)]
+EXPECTED = "".join(f"{qid}\tQUERY {qid}\n" for qid in range(100))
+
+
+class Crash(Exception):
+    pass
+
+
+def correct(chunk):
+    return [query.upper() for _, query in chunk]
+
+
+def run(output, crash_after=None, torn=False):
+    """Write the corrected `QUERIES` to `output` in chunks of 7 rows, crashing
+    after `crash_after` chunks, optionally halfway through writing the next one."""
+    with CheckpointedWriter(output, checkpoint_every=20) as writer:
+        for i, chunk in enumerate(chunked(writer.skip(QUERIES), 7)):
+            if i == crash_after:
+                if torn:
+                    fixed = correct(chunk)
+
+                    def crash_halfway():
+                        yield from fixed[:3]
+                        raise Crash()
+
+                    writer.write(chunk, crash_halfway())
+                raise Crash()
+            writer.write(chunk, correct(chunk))
+
+
+def read(filename):
+    with open(filename, "r", encoding="utf8") as f:
+        return f.read()
+
+
+def test_uninterrupted(tmp_path):
+    output = str(tmp_path / "fixed.tsv")
+    run(output)
+    assert read(output) == EXPECTED
+    assert sorted(os.listdir(tmp_path)) == ["fixed.tsv"]
+
+
+@pytest.mark.parametrize("torn", [False, True])
+def test_resume_after_crash(tmp_path, torn):
+    output = str(tmp_path / "fixed.tsv")
+    with pytest.raises(Crash):
+        run(output, crash_after=5, torn=torn)
+    assert not os.path.exists(output)
+    assert os.path.exists(f"{output}.checkpoint")
+
+    run(output)
+    assert read(output) == EXPECTED
+    assert sorted(os.listdir(tmp_path)) == ["fixed.tsv"]
+
+
+def test_partial_without_checkpoint_is_discarded(tmp_path):
+    output = str(tmp_path / "fixed.tsv")
+    with open(f"{output}.partial", "w", encoding="utf8") as f:
+        f.write("0\tstale\n1\tsta")
+    run(output)
+    assert read(output) == EXPECTED
+
+
+def test_resume_with_other_input(tmp_path):
+    output = str(tmp_path / "fixed.tsv")
+    with pytest.raises(Crash):
+        run(output, crash_after=5)
+    with pytest.raises(ValueError):
+        with CheckpointedWriter(output, checkpoint_every=20) as writer:
+            list(writer.skip(reversed(QUERIES)))
@@ -0,0 +1,84 @@
+import struct
+
+import pytest
+
+from src.lexicon import (
+    HEADERS,
+    MAGIC,
+    Lexicon,
+    SharedLexicon,
+    compile_lexicon,
+    lexicon_bytes,
+)
+
+PARSED = {
+    "abilty": ("ability",),
+    "a bout": ("about", "a bit"),
+    "teh": ("the", "ten", "tea"),
+    "café": ("cafe",),
+    "zz": ("",),
+}
+
+
+def version_1_bytes(parsed):
+    """Return `parsed` in the format of version 1, which has no hash slots."""
+    data = lexicon_bytes(parsed)
+    _, _, n, m, capacity = HEADERS[2].unpack_from(data, 0)
+    tables = data[HEADERS[2].size :]
+    offsets = 4 * (2 * (n + 1) + m + 1)
+    return (
+        HEADERS[1].pack(MAGIC, 1, n, m)
+        + tables[:offsets]
+        + tables[offsets + 4 * capacity :]
+    )
+
+
+def check(lexicon, parsed):
+    assert len(lexicon) == len(parsed)
+    assert dict(lexicon.items()) == parsed
+    assert sorted(lexicon) == sorted(parsed)
+    for key, value in parsed.items():
+        assert key in lexicon
+        assert lexicon[key] == value
+        assert lexicon.get(key) == value
+    for key in ("", "ability", "a", "abilt", "zzz"):
+        assert key not in lexicon
+        assert lexicon.get(key, (key,)) == (key,)
+    with pytest.raises(KeyError):
+        lexicon["ability"]
+
+
+@pytest.mark.parametrize("parsed", [PARSED, {}])
+def test_version_2(tmp_path, parsed):
+    filename = str(tmp_path / "parsed.lex")
+    compile_lexicon(parsed, filename)
+    lexicon = Lexicon(filename)
+    assert lexicon.version == 2
+    check(lexicon, parsed)
+    lexicon.close()
+
+
+def test_version_1(tmp_path):
+    filename = tmp_path / "parsed.lex"
+    filename.write_bytes(version_1_bytes(PARSED))
+    lexicon = Lexicon(str(filename))
+    assert lexicon.version == 1
+    check(lexicon, PARSED)
+    lexicon.close()
+
+
+def test_invalid(tmp_path):
+    filename = tmp_path / "parsed.json"
+    filename.write_bytes(struct.pack("<4sIIII", b"{}  ", 2, 0, 0, 0))
+    with pytest.raises(IOError):
+        Lexicon(str(filename))
+
+
+def test_shared():
+    lexicon = SharedLexicon.create(PARSED)
+    try:
+        attached = SharedLexicon.attach(lexicon.name)
+        check(attached, PARSED)
+        attached.close()
+    finally:
+        lexicon.unlink()
@@ -0,0 +1,63 @@
+import io
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+import msmarco_doc_eval as evaluation
+
+
+def synthetic_files(seed, n_queries=200, n_documents=50):
+    """Return qrels and a run in MS MARCO format, with shuffled lines, tied ranks,
+    unjudged queries and queries without candidates."""
+    rng = random.Random(seed)
+    qrels, run = [], []
+    for qid in range(n_queries):
+        if rng.random() < 0.9:
+            for did in rng.sample(range(n_documents), rng.randint(1, 3)):
+                qrels.append(f"{qid} 0 D{did} {rng.randint(0, 3)}\n")
+        if rng.random() < 0.9:
+            for rank, did in enumerate(rng.sample(range(n_documents), 10), start=1):
+                if rng.random() < 0.1:
+                    rank = max(rank - 1, 1)
+                run.append(f"{qid}\tD{did}\t{rank}\n")
+    rng.shuffle(run)
+    return "".join(qrels), "".join(run)
+
+
+def legacy_metrics(qrels, run, exclude_qids):
+    return evaluation.compute_metrics(
+        evaluation.load_reference_from_stream(io.StringIO(qrels)),
+        evaluation.load_candidate_from_stream(io.StringIO(run)),
+        exclude_qids,
+    )
+
+
+def array_metrics(qrels, run, exclude_qids):
+    qrels = evaluation.load_reference_arrays_from_stream(io.StringIO(qrels))
+    run = evaluation.load_candidate_arrays_from_stream(
+        io.StringIO(run), qrels.vocabulary
+    )
+    return evaluation.compute_metrics_arrays(qrels, run, exclude_qids)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_mrr_equals_legacy(seed):
+    qrels, run = synthetic_files(seed)
+    for exclude_qids in (set(), {0, 1, 2, 3, 4, 5}):
+        legacy = legacy_metrics(qrels, run, exclude_qids)
+        metrics = array_metrics(qrels, run, exclude_qids)
+        assert metrics["MRR @10"] == legacy["MRR @10"]
+        assert metrics["QueriesRanked"] == legacy["QueriesRanked"]
+
+
+def test_metrics():
+    qrels = "1 0 A 1\n1 0 B 2\n2 0 C 1\n"
+    run = "1\tX\t1\n1\tB\t2\n1\tA\t3\n2\tY\t1\n"
+    metrics = array_metrics(qrels, run, set())
+    assert metrics["MRR @10"] == pytest.approx((1 / 2 + 0) / 2)
+    assert metrics["MAP @10"] == pytest.approx(((1 / 2 + 2 / 3) / 2 + 0) / 2)
+    assert metrics["Recall @10"] == pytest.approx((1 + 0) / 2)
+    dcg = 2 / np.log2(3) + 1 / np.log2(4)
+    idcg = 2 / np.log2(2) + 1 / np.log2(3)
+    assert metrics["nDCG @10"] == pytest.approx((dcg / idcg + 0) / 2)
@@ -0,0 +1,87 @@
+import pytest
+
+from src.parser import is_filtered
+from src.phrases import PhraseMatcher
+from src.queries import fix_query_corpora
+
+PHRASES = PhraseMatcher(
+    {
+        "a bout": "about",
+        "a bout time": "about time",
+        "bout time for": "time for",
+        "honk kong": "hong kong",
+        "new yrok city": "new york city",
+        "tme": "time",
+    }
+)
+FIXES = {"tme": "time", "honk": "hong"}
+
+
+def rewrite(query):
+    return " ".join(
+        PHRASES.rewrite(query.split(), lambda token: FIXES.get(token, token))
+    )
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        # The longest phrase at a position wins
+        ("a bout", "about"),
+        ("a bout time", "about time"),
+        ("is it a bout time for tea", "is it about time for tea"),
+        # The leftmost phrase wins, even if a later overlapping phrase is longer
+        ("a bout time for", "about time for"),
+        ("bout time for", "time for"),
+        # Tokens outside phrases are fixed one by one
+        ("a bout tme", "about time"),
+        ("honk", "hong"),
+        ("honk kong", "hong kong"),
+        # A partial phrase falls back to the fixes of its tokens
+        ("new yrok", "new yrok"),
+        ("new yrok city", "new york city"),
+        ("a", "a"),
+        ("", ""),
+    ],
+)
+def test_rewrite(query, expected):
+    assert rewrite(query) == expected
+
+
+def test_single_token_misspellings_are_ignored():
+    assert len(PHRASES) == 5
+    assert PHRASES.max_tokens == 3
+
+
+def test_may_match():
+    assert PHRASES.may_match("a bout".split())
+    assert not PHRASES.may_match(["a"])
+    assert not PHRASES.may_match("a cat".split())
+    assert not PHRASES.may_match("city new".split())
+
+
+def test_from_misspellings():
+    parsed_errors = {"a bout": ("about", "a boat"), "teh": ("the",)}
+    phrases = PhraseMatcher.from_misspellings(parsed_errors)
+    assert len(phrases) == 1
+    assert fix_query_corpora("teh fight a bout", parsed_errors, phrases) == (
+        "the fight about"
+    )
+    assert fix_query_corpora("teh fight a bout", parsed_errors) == "the fight a bout"
+
+
+@pytest.mark.parametrize(
+    "wrong, expected",
+    [
+        ("cafe", True),
+        ("teh", False),
+        # Multi-token misspellings of valid English words
+        ("a belt", True),
+        ("May be", True),
+        # Multi-token misspellings with a misspelled token
+        ("a nother", False),
+        ("honk kong", False),
+    ],
+)
+def test_is_filtered(wrong, expected):
+    assert is_filtered(wrong, {"cafe", "a", "belt", "may", "be", "kong"}) == expected
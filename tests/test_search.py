@@ -0,0 +1,66 @@
+from src.search import BM25Searcher, search_incremental
+
+DOCUMENTS = {
+    "D1": "spelling correction of queries",
+    "D2": "ranking systems",
+    "D3": "the spelling of ranking",
+}
+
+
+class CountingSearcher(BM25Searcher):
+    def __init__(self, documents):
+        super().__init__(documents)
+        self.searched = []
+
+    def search_batch(self, queries, k=10, threads=1):
+        self.searched.extend(queries)
+        return super().search_batch(queries, k=k, threads=threads)
+
+
+def write(filename, lines):
+    filename.write_text("".join(lines), encoding="utf8")
+    return str(filename)
+
+
+def test_bm25():
+    searcher = BM25Searcher(DOCUMENTS)
+    hits = searcher.search_batch({"1": "Spelling", "2": "ranking systems"}, k=2)
+    assert [docid for docid, _ in hits["1"]] == ["D1", "D3"]
+    assert [docid for docid, _ in hits["2"]] == ["D2", "D3"]
+    assert searcher.search("unknown") == []
+
+
+def test_search_incremental(tmp_path):
+    original = write(
+        tmp_path / "queries.tsv",
+        ["1\tspeling\n", "2\tranking  systems\n", "3\tspelling\n"],
+    )
+    # Query 2 only differs in whitespace, so only query 1 needs to be searched
+    fixed = write(
+        tmp_path / "1_fixed_queries.tsv",
+        ["1\tspelling\n", "2\tranking systems\n", "3\tspelling\n"],
+    )
+    baseline = write(
+        tmp_path / "0_rank.txt",
+        [
+            "2 Q0 D2 1 1.000000 Anserini\n",
+            "3 Q0 D1 1 1.000000 Anserini\n",
+            "3 Q0 D3 2 0.500000 Anserini\n",
+        ],
+    )
+    output = str(tmp_path / "1_rank.txt")
+    searcher = CountingSearcher(DOCUMENTS)
+
+    assert search_incremental(searcher, fixed, original, baseline, output, k=2) == 1
+    assert searcher.searched == ["1"]
+    with open(output, "r", encoding="utf8") as f:
+        lines = f.read().splitlines()
+    assert lines[:3] == [
+        "2 Q0 D2 1 1.000000 Anserini",
+        "3 Q0 D1 1 1.000000 Anserini",
+        "3 Q0 D3 2 0.500000 Anserini",
+    ]
+    assert [line.split()[:4] for line in lines[3:]] == [
+        ["1", "Q0", "D1", "1"],
+        ["1", "Q0", "D3", "2"],
+    ]
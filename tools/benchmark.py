@@ -0,0 +1,382 @@
+"""
+Reproducible benchmarks of the correction and evaluation pipeline, on synthetic data.
+
+Every stage runs in a fresh process, so its startup time (imports, loading corpora
+or models) and peak resident memory are measured in isolation. Queries, qrels and
+runs are generated from a seed, so no licensed MS MARCO data is needed. Correcters
+whose packages are not installed are replaced by a stub model with a fixed cost per
+batch and per token, which still exercises the batching, deduplication and I/O code.
+
+e.g:
+
+    python tools/benchmark.py --sizes 1000 100000 --save-baseline main
+    python tools/benchmark.py --sizes 1000 100000 --compare main
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import get_context
+from typing import Dict, Iterator, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+BASELINES = os.path.join(ROOT, "benchmarks")
+STAGES = ["parse", "corpora", "correcter", "evaluate", "evaluate-legacy"]
+CORRECTERS = ["autocorrect", "symspellcorrecter", "bertcorrecter"]
+
+# Cost of the stub model, per call and per token
+STUB_BATCH_SECONDS = 1e-3
+STUB_TOKEN_SECONDS = 2e-5
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Return the peak resident set size of this process in MiB, if available."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS, and in KiB elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def load_words() -> List[str]:
+    from src.symspell import ENGLISH_WORDS
+
+    words = set()
+    for filename in ENGLISH_WORDS:
+        with open(os.path.join(ROOT, filename), "r", encoding="utf8") as f:
+            words.update(word.strip().lower() for word in f if word.strip().isalpha())
+    return sorted(words)
+
+
+def misspell(word: str, rng: random.Random) -> str:
+    """Apply a random deletion, insertion, substitution or transposition to `word`."""
+    i = rng.randrange(len(word))
+    edit = rng.randrange(4)
+    letter = rng.choice(string.ascii_lowercase)
+    if edit == 0 and len(word) > 1:
+        return word[:i] + word[i + 1 :]
+    if edit == 1:
+        return word[:i] + letter + word[i:]
+    if edit == 2:
+        return word[:i] + letter + word[i + 1 :]
+    if i + 1 < len(word):
+        return word[:i] + word[i + 1] + word[i] + word[i + 2 :]
+    return word + letter
+
+
+def synthetic_queries(
+    n: int,
+    seed: int = 0,
+    words: Optional[List[str]] = None,
+    misspellings: Optional[List[str]] = None,
+    typo_rate: float = 0.1,
+) -> Iterator[Tuple[str, str]]:
+    """Yield `n` synthetic `(qid, query)` rows of 2 to 8 words. Each word is
+    misspelled with probability `typo_rate`, half of the time by picking one of
+    the known `misspellings`, if given, and otherwise by a random edit.
+    """
+    rng = random.Random(seed)
+    words = words or load_words()
+    for qid in range(1, n + 1):
+        tokens = []
+        for _ in range(rng.randint(2, 8)):
+            if rng.random() >= typo_rate:
+                tokens.append(rng.choice(words))
+            elif misspellings and rng.random() < 0.5:
+                tokens.append(rng.choice(misspellings))
+            else:
+                tokens.append(misspell(rng.choice(words), rng))
+        yield str(qid), " ".join(tokens)
+
+
+def write_synthetic_run(
+    folder: str, n: int, seed: int = 0, hits: int = 10, n_documents: int = 100_000
+) -> Tuple[str, str, str]:
+    """Write synthetic qrels, and a matching run in MS MARCO and TREC format, for
+    `n` queries to `folder`. Returns the paths of the three files.
+    """
+    rng = random.Random(seed)
+    paths = tuple(
+        os.path.join(folder, name) for name in ("qrels.tsv", "run.tsv", "run.trec")
+    )
+    with open(paths[0], "w") as qrels, open(paths[1], "w") as run, open(
+        paths[2], "w"
+    ) as trec:
+        for qid in range(1, n + 1):
+            relevant = rng.sample(range(n_documents), rng.randint(1, 3))
+            qrels.writelines(f"{qid} 0 D{doc} 1\n" for doc in relevant)
+            # Place a relevant document in the ranking for about a third of the queries
+            ranking = rng.sample(range(n_documents), hits)
+            if rng.random() < 1 / 3:
+                ranking[rng.randrange(hits)] = relevant[0]
+            for rank, doc in enumerate(dict.fromkeys(ranking), start=1):
+                run.write(f"{qid}\tD{doc}\t{rank}\n")
+                trec.write(f"{qid} Q0 D{doc} {rank} {100 - rank}.0 synthetic\n")
+    return paths
+
+
+def stub_correcter(name: str):
+    """Return a correcter with a stub model in place of the `name` correcter,
+    passing queries through unchanged at a fixed cost per batch and per token."""
+    from src.autocorrect import NeuspellCorrecter
+
+    class StubChecker:
+        def correct_strings(self, queries: List[str]) -> List[str]:
+            tokens = sum(len(query.split()) for query in queries)
+            time.sleep(STUB_BATCH_SECONDS + STUB_TOKEN_SECONDS * tokens)
+            return list(queries)
+
+        def correct(self, query: str) -> str:
+            return self.correct_strings([query])[0]
+
+    class StubCorrecter(NeuspellCorrecter):
+        def __init__(self) -> None:
+            super().__init__()
+            self.checker = StubChecker()
+
+        @property
+        def name(self) -> str:
+            return f"stub{name}"
+
+    return StubCorrecter()
+
+
+def run_stage(stage: str, size: int, seed: int, folder: str, correcter: str) -> Dict:
+    """Run a single benchmark stage in this process, and return its measurements.
+    The startup time covers imports and loading corpora or models, but not the
+    generation of synthetic data.
+    """
+    notes = ""
+    if stage == "parse":
+        start = time.perf_counter()
+        from src.parser import parse
+
+        startup = time.perf_counter()
+        items = len(parse(15))
+    elif stage == "corpora":
+        from src.parser import parse
+
+        misspellings = list(parse(15))
+        queries = list(synthetic_queries(size, seed, misspellings=misspellings))
+        start = time.perf_counter()
+        from src.queries import fix_queries_corpora
+
+        parsed_errors = parse(15)
+        startup = time.perf_counter()
+        fix_queries_corpora(
+            15, queries, parsed_errors, output=os.path.join(folder, "corpora.tsv")
+        )
+        items = len(queries)
+    elif stage == "correcter":
+        queries = list(synthetic_queries(size, seed))
+        start = time.perf_counter()
+        from src.autocorrect import get_correcter
+        from src.queries import fix_queries_autocorrect
+
+        try:
+            model = get_correcter(correcter)
+        except ImportError as exc:
+            model = stub_correcter(correcter)
+            notes = f"stub model, {exc.name} is not installed"
+            # Stubbed timings are not comparable to those of the real correcter
+            correcter = f"stub-{correcter}"
+        model.warm_up()
+        startup = time.perf_counter()
+        fix_queries_autocorrect(
+            model, queries, output=os.path.join(folder, f"{correcter}.tsv")
+        )
+        items = len(queries)
+    elif stage in ("evaluate", "evaluate-legacy"):
+        path_to_reference, path_to_candidate, _ = write_synthetic_run(
+            folder, size, seed
+        )
+        start = time.perf_counter()
+        import msmarco_doc_eval
+
+        startup = time.perf_counter()
+        if stage == "evaluate":
+            msmarco_doc_eval.compute_metrics_arrays_from_files(
+                path_to_reference, path_to_candidate, set()
+            )
+        else:
+            msmarco_doc_eval.compute_metrics_from_files(
+                path_to_reference, path_to_candidate, set()
+            )
+        items = size
+    else:
+        raise ValueError(f"Unknown stage {stage!r}, expected one of {STAGES}.")
+
+    seconds = time.perf_counter() - startup
+    return {
+        "stage": stage if stage != "correcter" else f"correcter:{correcter}",
+        "size": size if stage != "parse" else 0,
+        "items": items,
+        "startup_s": round(startup - start, 4),
+        "seconds": round(seconds, 4),
+        "items_per_s": round(items / seconds, 1) if seconds else None,
+        "peak_rss_mb": round(peak_rss_mb() or 0, 1) or None,
+        "notes": notes,
+    }
+
+
+def _run_stage_child(connection, *args) -> None:
+    import contextlib
+    import io
+
+    try:
+        # Keep the output of the benchmarked code out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = run_stage(*args)
+    except Exception as exc:
+        result = {"error": f"{type(exc).__name__}: {exc}"}
+    connection.send(result)
+    connection.close()
+
+
+def run_isolated(stage: str, size: int, seed: int, correcter: str = "") -> Dict:
+    """Run `run_stage` in a fresh process, for isolated startup times and peak RSS."""
+    context = get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    with tempfile.TemporaryDirectory() as folder:
+        process = context.Process(
+            target=_run_stage_child,
+            args=(sender, stage, size, seed, folder, correcter),
+        )
+        process.start()
+        sender.close()
+        result = receiver.recv()
+        process.join()
+    if "error" in result:
+        raise RuntimeError(f"Stage {stage} {correcter} failed: {result['error']}")
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(results: List[Dict], baseline: Optional[List[Dict]] = None) -> None:
+    """Print `results` as a table, with the relative change from `baseline`, if given."""
+    previous = {(result["stage"], result["size"]): result for result in baseline or []}
+    header = ["stage", "size", "items/s", "startup s", "peak MiB"]
+    if baseline is not None:
+        header += ["speedup", "memory"]
+    rows = [header]
+    for result in results:
+        row = [
+            result["stage"],
+            str(result["size"]),
+            str(result["items_per_s"]),
+            str(result["startup_s"]),
+            str(result["peak_rss_mb"]),
+        ]
+        if baseline is not None:
+            old = previous.get((result["stage"], result["size"]))
+            if old and old["items_per_s"] and result["items_per_s"]:
+                row.append(f"{result['items_per_s'] / old['items_per_s']:.2f}x")
+            else:
+                row.append("-")
+            if old and old["peak_rss_mb"] and result["peak_rss_mb"]:
+                row.append(f"{result['peak_rss_mb'] / old['peak_rss_mb']:.2f}x")
+            else:
+                row.append("-")
+        if result["notes"]:
+            row.append(result["notes"])
+        rows.append(row)
+    widths = [
+        max(len(row[i]) for row in rows if i < len(row)) for i in range(len(header))
+    ]
+    for row in rows:
+        print(
+            "  ".join(cell.ljust(width) for cell, width in zip(row, widths)),
+            *row[len(widths) :],
+        )
+
+
+def main(args) -> None:
+    results = []
+    for stage in args.stages:
+        if stage == "parse":
+            results.append(run_isolated(stage, 0, args.seed))
+            continue
+        for size in args.sizes:
+            if stage == "correcter":
+                if size > args.correcter_limit and args.correcter_limit in args.sizes:
+                    continue
+                for correcter in args.correcters:
+                    limited = min(size, args.correcter_limit)
+                    results.append(run_isolated(stage, limited, args.seed, correcter))
+            else:
+                results.append(run_isolated(stage, size, args.seed))
+
+    baseline = None
+    if args.compare:
+        with open(os.path.join(BASELINES, f"{args.compare}.json"), "r") as f:
+            baseline = json.load(f)["results"]
+    print_report(results, baseline)
+
+    if args.save_baseline:
+        os.makedirs(BASELINES, exist_ok=True)
+        with open(os.path.join(BASELINES, f"{args.save_baseline}.json"), "w") as f:
+            json.dump(
+                {
+                    "commit": git_commit(),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "seed": args.seed,
+                    "results": results,
+                },
+                f,
+                indent=4,
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark parsing, corpus rewriting, correcters and evaluation."
+    )
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 10_000], help="Query counts."
+    )
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument(
+        "--correcters",
+        nargs="+",
+        default=CORRECTERS,
+        help="Registered correcter names, replaced by a stub if unavailable.",
+    )
+    parser.add_argument(
+        "--correcter-limit",
+        type=int,
+        default=10_000,
+        help="Maximum number of queries per correcter benchmark.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--save-baseline", metavar="NAME", help="Store the results as a baseline."
+    )
+    parser.add_argument(
+        "--compare", metavar="NAME", help="Compare the results with a stored baseline."
+    )
+    main(parser.parse_args())
@@ -7,8 +7,22 @@ Authors: Daniel Campos, Rutger van Haasteren, Jimmy Lin
 import argparse
 import re
 import os
+import sys
 
 from collections import Counter
+from contextlib import nullcontext
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    # Optional timings of the evaluation stages, see src/instrument.py
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from src import instrument
+except ImportError:
+    instrument = None
 
 MaxMRRRank = 10
 
@@ -28,6 +42,11 @@ def autoopen(filename, mode="rt"):
     return open(filename, mode)
 
 
+def timer(name):
+    """Time the stage `name` if instrumentation is available, see src/instrument.py."""
+    return instrument.timer(name) if instrument else nullcontext()
+
+
 def load_reference_from_stream(f):
     """Load Reference reference relevant document
     Args:f (stream): stream to load.
@@ -89,14 +108,30 @@ def load_candidate_from_stream(f):
     return {qid: sorted(qid_to_ranked_candidate_documents[qid], key=lambda x:(x[1], x[0]), reverse=False) for qid in qid_to_ranked_candidate_documents}         
 
 
-def load_candidate(path_to_candidate):
+def candidate_stream(f, trec=False):
+    """Return the lines of `f` in MS MARCO format, converting a TREC-formatted run on the fly.
+    Args:
+    f (stream): stream of the candidate file.
+    trec (bool): whether `f` is in TREC format, see `trec_to_msmarco_run.py`.
+    Returns:iterable: lines of "QUERYID\tdocumentID\tRank"
+    """
+    if not trec:
+        return f
+    from trec_to_msmarco_run import trec_to_msmarco_lines
+
+    return trec_to_msmarco_lines(f, quiet=True)
+
+
+def load_candidate(path_to_candidate, trec=False):
     """Load candidate data from a file.
-    Args:path_to_candidate (str): path to file to load.
+    Args:
+    path_to_candidate (str): path to file to load.
+    trec (bool): whether the file is in TREC format.
     Returns:qid_to_ranked_candidate_documents (dict): dictionary mapping from query_id (int) to a list of 1000 document ids(int) ranked by relevance and importance
     """
     
     with autoopen(path_to_candidate,'r') as f:
-        qid_to_ranked_candidate_documents = load_candidate_from_stream(f)
+        qid_to_ranked_candidate_documents = load_candidate_from_stream(candidate_stream(f, trec))
     return qid_to_ranked_candidate_documents
 
 
@@ -164,7 +199,7 @@ def compute_metrics(qids_to_relevant_documentids, qids_to_ranked_candidate_docum
     return all_scores
 
 
-def compute_metrics_from_files(path_to_reference, path_to_candidate, exclude_qids, perform_checks=True):
+def compute_metrics_from_files(path_to_reference, path_to_candidate, exclude_qids, perform_checks=True, trec=False):
     """Compute MRR metric
     Args:    
     p_path_to_reference_file (str): path to reference file.
@@ -180,13 +215,428 @@ def compute_metrics_from_files(path_to_reference, path_to_candidate, exclude_qid
     Returns:
         dict: dictionary of metrics {'MRR': <MRR Score>}
     """
-    qids_to_relevant_documentids = load_reference(path_to_reference)
-    qids_to_ranked_candidate_documents = load_candidate(path_to_candidate)
+    with timer('evaluate.load_reference'):
+        qids_to_relevant_documentids = load_reference(path_to_reference)
+    with timer('evaluate.load_candidate'):
+        qids_to_ranked_candidate_documents = load_candidate(path_to_candidate, trec)
     if perform_checks:
         allowed, message = quality_checks_qids(qids_to_relevant_documentids, qids_to_ranked_candidate_documents)
         if message != '': print(message)
 
-    return compute_metrics(qids_to_relevant_documentids, qids_to_ranked_candidate_documents, exclude_qids)
+    with timer('evaluate.compute'):
+        return compute_metrics(qids_to_relevant_documentids, qids_to_ranked_candidate_documents, exclude_qids)
+
+
+class Qrels:
+    """Relevance judgments as compact arrays, sorted by (qid, document code).
+    Attributes:
+        qids (np.ndarray): int64 query ids.
+        dids (np.ndarray): int32 document codes, see `DocumentVocabulary`.
+        gains (np.ndarray): float64 relevance levels.
+        keys (np.ndarray): sorted int64 keys combining qids and dids, for vectorized lookups.
+        vocabulary (DocumentVocabulary): the interned document ids.
+    """
+    def __init__(self, qids, dids, gains, vocabulary):
+        self.keys = pair_keys(qids, dids)
+        order = np.argsort(self.keys, kind='stable')
+        self.keys = self.keys[order]
+        self.qids = qids[order]
+        self.dids = dids[order]
+        self.gains = gains[order]
+        self.vocabulary = vocabulary
+
+    def lookup(self, qids, dids):
+        """Return the relevance level of each (qid, did) pair, or -1 if it is not judged."""
+        keys = pair_keys(qids, dids)
+        index = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[index] == keys, self.gains[index], -1.0)
+
+
+class Run:
+    """Ranked candidates as compact arrays, one entry per line of the run file.
+    Attributes:
+        qids (np.ndarray): int64 query ids.
+        dids (np.ndarray): int32 document codes, see `DocumentVocabulary`.
+        ranks (np.ndarray): int32 ranks.
+        vocabulary (DocumentVocabulary): the interned document ids.
+        is_sorted (bool): whether each query's candidates are contiguous and in increasing rank order.
+        offsets (np.ndarray): if `is_sorted`, the start of each query's candidates, followed by the length.
+    """
+    def __init__(self, qids, dids, ranks, vocabulary):
+        if len(qids) == 0:
+            # Like `compute_metrics`, e.g. for a reduced run without modified queries
+            raise IOError("No matching QIDs found. Are you sure you are scoring the evaluation set?")
+        self.qids = qids
+        self.dids = dids
+        self.ranks = ranks
+        self.vocabulary = vocabulary
+        starts = np.flatnonzero(np.r_[True, qids[1:] != qids[:-1]])
+        self.is_sorted = (len(np.unique(qids[starts])) == len(starts)
+                          and bool(np.all((ranks[1:] > ranks[:-1]) | (qids[1:] != qids[:-1]))))
+        self.offsets = np.r_[starts, len(qids)] if self.is_sorted else None
+
+
+class DocumentVocabulary:
+    """Interns document ids as int32 codes, shared between judgments and runs."""
+    def __init__(self):
+        self.codes = {}
+        self._ids = None
+
+    def encode(self, dids):
+        codes = self.codes
+        self._ids = None
+        return np.array([codes.setdefault(did, len(codes)) for did in dids], dtype=np.int32)
+
+    def ids(self):
+        """Return all interned document ids, indexed by their code."""
+        if self._ids is None:
+            self._ids = np.array(list(self.codes))
+        return self._ids
+
+    def lexicographic_ranks(self):
+        """Return, per code, the position of its document id in sorted order."""
+        ranks = np.empty(len(self.codes), dtype=np.int64)
+        ranks[np.argsort(self.ids())] = np.arange(len(self.codes))
+        return ranks
+
+
+def pair_keys(qids, dids):
+    """Combine query ids and document codes into single int64 keys."""
+    return (qids.astype(np.int64) << 32) | dids.astype(np.int64)
+
+
+def read_columns(f, columns, converters, chunk_lines=1 << 16):
+    """Read whitespace-separated columns from a stream in bulk, `chunk_lines` lines at a time.
+    Each chunk of string values is converted to an array before the next chunk is read,
+    so memory use is bounded by the arrays, not by the number of string values.
+    Args:
+    f (stream): stream to load.
+    columns (list): the indices of the columns to return.
+    converters (list): per column, a function converting a list of string values to an array.
+    Returns:
+        list: per requested column, an array of its converted values
+    """
+    from itertools import islice
+
+    arrays = [[] for _ in columns]
+    while True:
+        lines = list(islice(f, chunk_lines))
+        if not lines:
+            break
+        tokens = ''.join(lines).split()
+        width = len(tokens) // len(lines)
+        if width <= max(columns) or any(len(line.split()) != width for line in lines):
+            # Lines of different widths, e.g. qrels without a relevance column on some lines,
+            # whose values can only be assigned to their columns line by line
+            rows = [line.split() for line in lines]
+            for row in rows:
+                if len(row) < max(columns) + 1 and len(row) < 3:
+                    raise IOError('\"%s\" is not valid format' % row)
+            values = [[row[column] if column < len(row) else '1' for row in rows] for column in columns]
+        else:
+            values = [tokens[column::width] for column in columns]
+        del lines, tokens
+        for array, convert, value in zip(arrays, converters, values):
+            array.append(convert(value))
+    return [np.concatenate(array) if array else convert([]) for array, convert in zip(arrays, converters)]
+
+
+def to_int_array(values, dtype):
+    """Parse a list of numeric strings into an array of `dtype`."""
+    parse = float if np.issubdtype(dtype, np.floating) else int
+    try:
+        return np.fromiter(map(parse, values), dtype=dtype, count=len(values))
+    except ValueError as error:
+        raise IOError('Invalid format: {}'.format(error))
+
+
+def load_reference_arrays_from_stream(f, vocabulary=None):
+    """Load relevance judgments from a stream into a `Qrels`, in bulk.
+    Lines are "QUERYID ITER DOCID RELEVANCE" (TREC), or "QUERYID ITER DOCID" with relevance 1.
+    Args:
+    f (stream): stream to load.
+    vocabulary (DocumentVocabulary): vocabulary to intern the document ids in, optional.
+    Returns:Qrels: the judgments as arrays.
+    """
+    vocabulary = vocabulary or DocumentVocabulary()
+    qids, dids, gains = read_columns(f, [0, 2, 3], [
+        lambda values: to_int_array(values, np.int64),
+        vocabulary.encode,
+        lambda values: to_int_array(values, np.float64),
+    ])
+    return Qrels(qids, dids, gains, vocabulary)
+
+
+def load_candidate_arrays_from_stream(f, vocabulary=None):
+    """Load candidate data from a stream into a `Run`, in bulk.
+    Args:
+    f (stream): stream to load, with lines "QUERYID\tdocumentID\tRank".
+    vocabulary (DocumentVocabulary): vocabulary to intern the document ids in, e.g. that of the `Qrels`.
+    Returns:Run: the candidates as arrays.
+    """
+    vocabulary = vocabulary or DocumentVocabulary()
+    qids, dids, ranks = read_columns(f, [0, 1, 2], [
+        lambda values: to_int_array(values, np.int64),
+        vocabulary.encode,
+        lambda values: to_int_array(values, np.int32),
+    ])
+    return Run(qids, dids, ranks, vocabulary)
+
+
+def quality_checks_arrays(run):
+    """Perform the duplicate check of `quality_checks_qids` on a `Run`: a query may not
+    contain the same (document, rank) candidate multiple times.
+    Args:run (Run): candidates, as loaded by `load_candidate_arrays_from_stream`.
+    Returns:
+        bool,str: Boolean whether allowed, message to be shown in case of a problem
+    """
+    # A stable sort keeps equal candidates in run order, so the first of each group of
+    # duplicates is its first occurrence, without materializing a matrix of all candidates
+    order = np.lexsort((run.ranks, run.dids, run.qids))
+    qids, dids, ranks = run.qids[order], run.dids[order], run.ranks[order]
+    duplicate = (qids[1:] == qids[:-1]) & (dids[1:] == dids[:-1]) & (ranks[1:] == ranks[:-1])
+    if not duplicate.any():
+        return True, ''
+    # Like `quality_checks_qids`, report the last query (in run order) with duplicates
+    starts = np.flatnonzero(duplicate & ~np.r_[False, duplicate[:-1]])
+    last = starts[np.argmax(order[starts])]
+    qid, did, rank = qids[last], dids[last], ranks[last]
+    message = "Cannot rank a document multiple times for a single query. QID={qid}, PID={pid}".format(
+        qid=int(qid), pid=(str(run.vocabulary.ids()[did]), int(rank)))
+    return False, message
+
+
+def group_positions(codes):
+    """For sorted group codes, return the 1-based position of each element within its group,
+    and the index of the first element of the group of each element."""
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    group_starts = np.repeat(starts, np.diff(np.r_[starts, len(codes)]))
+    return np.arange(len(codes)) - group_starts + 1, group_starts
+
+
+def per_query_metrics_arrays(qrels, run, exclude_qids, k=10):
+    """Compute the reciprocal rank, average precision@k, nDCG@k and recall@k of every
+    judged query that is not excluded, in one vectorized pass. The reciprocal rank
+    considers the full ranking, like `compute_metrics`. The other metrics only consider
+    the top `k` candidates of each query (like `trec_eval -M k`), with graded relevance.
+    Queries without candidates score 0.
+    Args:
+    qrels (Qrels): relevance judgments, as loaded by `load_reference_arrays_from_stream`.
+    run (Run): candidates, as loaded by `load_candidate_arrays_from_stream`.
+    exclude_qids (set): query ids to exclude.
+    k (int): the rank cutoff for MAP, nDCG and Recall.
+    Returns:
+        np.ndarray, dict: the evaluated query ids, ranked queries first in order of first
+        appearance in the run, and a dictionary of per-query metrics, e.g. {'RR @10': <array>}
+    """
+    # Code queries in order of first appearance in the run, followed by the judged-only
+    # queries, so that summing in code order matches the iteration order of `compute_metrics`.
+    if run.is_sorted:
+        run_qids = run.qids[run.offsets[:-1]]
+    else:
+        unique_qids, first_index = np.unique(run.qids, return_index=True)
+        run_qids = unique_qids[np.argsort(first_index)]
+    all_qids = np.r_[run_qids, np.setdiff1d(np.unique(qrels.qids), run_qids)]
+    sorter = np.argsort(all_qids)
+    def to_code(qids):
+        return sorter[np.searchsorted(all_qids, qids, sorter=sorter)]
+    n_queries = len(all_qids)
+    n_ranked = len(run_qids)
+
+    # Sort the candidates per query by (rank, document id), like `load_candidate_from_stream`.
+    # Sorted runs already are in this order, and document ids only matter for tied ranks.
+    qids, dids = run.qids, run.dids
+    if run.is_sorted:
+        codes = np.repeat(np.arange(n_ranked), np.diff(run.offsets))
+    else:
+        codes = to_code(run.qids)
+        if len(np.unique(pair_keys(run.qids, run.ranks))) < len(run.ranks):
+            ranking = np.lexsort((run.vocabulary.lexicographic_ranks()[run.dids], run.ranks, codes))
+        else:
+            ranking = np.lexsort((run.ranks, codes))
+        codes, qids, dids = codes[ranking], qids[ranking], dids[ranking]
+    gains = qrels.lookup(qids, dids)
+    positions, group_starts = group_positions(codes)
+
+    qrels_codes = to_code(qrels.qids)
+    evaluated = np.zeros(n_queries, dtype=bool)
+    evaluated[qrels_codes] = True
+    if exclude_qids:
+        evaluated &= ~np.isin(all_qids, list(exclude_qids))
+    if not evaluated[:n_ranked].any():
+        raise IOError("No matching QIDs found. Are you sure you are scoring the evaluation set?")
+
+    # Reciprocal rank: the first judged document in the full ranking counts
+    no_hit = np.iinfo(np.int64).max
+    first_hit = np.full(n_queries, no_hit)
+    hits = gains >= 0
+    np.minimum.at(first_hit, codes[hits], positions[hits])
+    reciprocal_rank = np.zeros(n_queries)
+    found = first_hit != no_hit
+    reciprocal_rank[found] = 1 / first_hit[found]
+
+    # MAP, nDCG and Recall over the top k candidates, with graded relevance
+    relevant = (gains > 0) & (positions <= k)
+    relevant_so_far = np.cumsum(relevant)
+    relevant_so_far -= relevant_so_far[group_starts] - relevant[group_starts]
+    precision_sum = np.bincount(codes, weights=np.where(relevant, relevant_so_far / positions, 0),
+                                minlength=n_queries)
+    retrieved = np.bincount(codes, weights=relevant, minlength=n_queries)
+    dcg = np.bincount(codes, weights=np.where(relevant, gains / np.log2(positions + 1), 0),
+                      minlength=n_queries)
+
+    n_relevant = np.bincount(qrels_codes, weights=qrels.gains > 0, minlength=n_queries)
+    ideal = np.lexsort((-qrels.gains, qrels_codes))
+    ideal_positions, _ = group_positions(qrels_codes[ideal])
+    ideal_gains = np.where(ideal_positions <= k, np.maximum(qrels.gains[ideal], 0), 0)
+    idcg = np.bincount(qrels_codes[ideal], weights=ideal_gains / np.log2(ideal_positions + 1),
+                       minlength=n_queries)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        average_precision = np.where(n_relevant > 0, precision_sum / n_relevant, 0)
+        ndcg = np.where(idcg > 0, dcg / idcg, 0)
+        recall = np.where(n_relevant > 0, retrieved / n_relevant, 0)
+
+    scores = {}
+    scores['RR @10'] = reciprocal_rank[evaluated]
+    scores['AP @{}'.format(k)] = average_precision[evaluated]
+    scores['nDCG @{}'.format(k)] = ndcg[evaluated]
+    scores['Recall @{}'.format(k)] = recall[evaluated]
+    return all_qids[evaluated], scores
+
+
+def compute_metrics_arrays(qrels, run, exclude_qids, k=10):
+    """Compute MRR, MAP, nDCG@k and Recall@k, by averaging `per_query_metrics_arrays`.
+    MRR is bit-identical to `compute_metrics`: like there, it is divided by the number
+    of judged queries, including excluded ones. MAP, nDCG@k and Recall@k are averaged
+    over all judged queries that are not excluded (like `trec_eval -c`).
+    Args:
+    qrels (Qrels): relevance judgments, as loaded by `load_reference_arrays_from_stream`.
+    run (Run): candidates, as loaded by `load_candidate_arrays_from_stream`.
+    exclude_qids (set): query ids to exclude.
+    k (int): the rank cutoff for MAP, nDCG and Recall.
+    Returns:
+        dict: dictionary of metrics, e.g. {'MRR @10': <MRR Score>, 'MAP @10': <MAP Score>}
+    """
+    qids, scores = per_query_metrics_arrays(qrels, run, exclude_qids, k=k)
+    MRR = 0
+    # Accumulate in the same order as `compute_metrics`, for bit-identical results
+    for reciprocal_rank in scores['RR @10'].tolist():
+        if reciprocal_rank:
+            MRR += reciprocal_rank
+    MRR = MRR/len(np.unique(qrels.qids))
+
+    all_scores = {}
+    all_scores['MRR @10'] = MRR
+    all_scores['MAP @{}'.format(k)] = float(scores['AP @{}'.format(k)].mean())
+    all_scores['nDCG @{}'.format(k)] = float(scores['nDCG @{}'.format(k)].mean())
+    all_scores['Recall @{}'.format(k)] = float(scores['Recall @{}'.format(k)].mean())
+    all_scores['QueriesRanked'] = len(set(np.unique(run.qids).tolist())-exclude_qids)
+    return all_scores
+
+
+def compute_metrics_arrays_from_files(path_to_reference, path_to_candidate, exclude_qids, k=10, trec=False):
+    """Compute MRR, MAP, nDCG@k and Recall@k, see `compute_metrics_arrays`.
+    Args:
+    path_to_reference (str): path to reference file.
+    path_to_candidate (str): path to candidate file, in MS MARCO format.
+    trec (bool): whether the candidate file is in TREC format instead.
+    Returns:
+        dict: dictionary of metrics
+    """
+    with timer('evaluate.load_reference'), autoopen(path_to_reference, 'r') as f:
+        qrels = load_reference_arrays_from_stream(f)
+    with timer('evaluate.load_candidate'):
+        run = load_candidate_arrays(path_to_candidate, qrels.vocabulary, trec=trec)
+    allowed, message = quality_checks_arrays(run)
+    if message != '': print(message)
+    with timer('evaluate.compute'):
+        return compute_metrics_arrays(qrels, run, exclude_qids, k=k)
+
+
+def load_candidate_arrays(path_to_candidate, vocabulary=None, verbose=True, trec=False):
+    """Load candidate data from a file into a `Run`, and report queries with too many documents.
+    Args:
+    path_to_candidate (str): path to file to load.
+    vocabulary (DocumentVocabulary): vocabulary to intern the document ids in, e.g. that of the `Qrels`.
+    trec (bool): whether the file is in TREC format, converted while it is read.
+    Returns:Run: the candidates as arrays.
+    """
+    with autoopen(path_to_candidate, 'r') as f:
+        run = load_candidate_arrays_from_stream(candidate_stream(f, trec), vocabulary)
+    if verbose:
+        unique_qids, first_index, counts = np.unique(run.qids, return_index=True, return_counts=True)
+        order = np.argsort(first_index)
+        for qid in unique_qids[order][counts[order] > MaxMRRRank]:
+            print('Too many documents ranked. Please Provide top 10 documents for qid:{}'.format(qid))
+        print('Quantity of Documents ranked for each query is as expected. Evaluating')
+    return run
+
+
+# Judgments shared with the worker processes of `compute_metrics_many_runs`
+_shared_qrels = None
+
+
+def _init_worker(qrels):
+    global _shared_qrels
+    if qrels is not None:
+        _shared_qrels = qrels
+
+
+def _evaluate_run(args):
+    path_to_candidate, exclude_qids, k, trec = args
+    run = load_candidate_arrays(path_to_candidate, _shared_qrels.vocabulary, verbose=False, trec=trec)
+    return path_to_candidate, compute_metrics_arrays(_shared_qrels, run, exclude_qids, k=k)
+
+
+def natural_key(path):
+    """Sort key so that e.g. "2_rank.txt" comes before "10_rank.txt"."""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', path)]
+
+
+def compute_metrics_many_runs(path_to_reference, paths_to_candidates, exclude_qids, k=10, processes=None, trec=False):
+    """Compute the metrics of `compute_metrics_arrays` for many runs, concurrently.
+    The judgments are loaded once. Where processes are forked, the workers share the
+    judgments of the parent process rather than receiving a pickled copy.
+    Args:
+    path_to_reference (str): path to reference file.
+    paths_to_candidates (list): paths to candidate files, in MS MARCO format.
+    exclude_qids (set): query ids to exclude.
+    k (int): the rank cutoff for MAP, nDCG and Recall.
+    processes (int): the number of worker processes, defaults to the number of CPUs.
+    trec (bool): whether the candidate files are in TREC format instead.
+    Returns:
+        dict: mapping from each candidate path to its dictionary of metrics, in natural order
+    """
+    import multiprocessing
+
+    global _shared_qrels
+    with timer('evaluate.load_reference'), autoopen(path_to_reference, 'r') as f:
+        _shared_qrels = load_reference_arrays_from_stream(f)
+
+    fork = 'fork' in multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if fork else None)
+    tasks = [(path, exclude_qids, k, trec) for path in sorted(paths_to_candidates, key=natural_key)]
+    processes = min(processes or os.cpu_count(), len(tasks)) or 1
+    with context.Pool(processes, _init_worker, (None if fork else _shared_qrels,)) as pool:
+        with timer('evaluate.runs'):
+            return dict(pool.map(_evaluate_run, tasks, chunksize=1))
+
+
+def write_table(results, path_to_output):
+    """Write the results of `compute_metrics_many_runs` as a JSON or TSV table,
+    depending on the extension of `path_to_output`."""
+    import json
+
+    if path_to_output.endswith('.json'):
+        with open(path_to_output, 'w') as f:
+            json.dump(results, f, indent=4)
+        return
+    metrics = sorted({metric for scores in results.values() for metric in scores})
+    with open(path_to_output, 'w') as f:
+        f.write('\t'.join(['run'] + metrics) + '\n')
+        for path, scores in results.items():
+            f.write('\t'.join([path] + [str(scores.get(metric, '')) for metric in metrics]) + '\n')
 
 
 def load_exclude(path_to_exclude_folder):
@@ -219,7 +669,22 @@ def main(args):
     path_to_candidate = args.run
     path_to_reference = args.judgments
 
-    metrics = compute_metrics_from_files(path_to_reference, path_to_candidate, exclude_qids)
+    if args.runs:
+        import glob
+
+        results = compute_metrics_many_runs(path_to_reference, glob.glob(args.runs), exclude_qids,
+                                            k=args.k, processes=args.processes, trec=args.trec)
+        if args.output:
+            write_table(results, args.output)
+        for path, metrics in results.items():
+            print('{}\t{}'.format(path, '\t'.join('{}: {}'.format(metric, metrics[metric]) for metric in sorted(metrics))))
+        return
+
+    if np is None or args.legacy:
+        metrics = compute_metrics_from_files(path_to_reference, path_to_candidate, exclude_qids, trec=args.trec)
+    else:
+        metrics = compute_metrics_arrays_from_files(path_to_reference, path_to_candidate, exclude_qids, k=args.k,
+                                                    trec=args.trec)
     print('#####################')
     for metric in sorted(metrics):
         print('{}: {}'.format(metric, metrics[metric]))
@@ -228,8 +693,18 @@ def main(args):
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Official evaluation script for the MS MARCO Document Ranking task.')
-    parser.add_argument('--run', type=str, metavar='file', required=True, help='Run file.')
+    parser.add_argument('--run', type=str, metavar='file', help='Run file.')
+    parser.add_argument('--runs', type=str, metavar='glob', help='Glob of run files, evaluated concurrently.')
+    parser.add_argument('--output', type=str, metavar='file', help='Write the --runs results to this .json or .tsv file.')
+    parser.add_argument('--processes', type=int, help='Number of processes for --runs, defaults to the number of CPUs.')
     parser.add_argument('--judgments', type=str, metavar='file', required=True, help='Judgments.')
     parser.add_argument('--exclude', type=str, metavar='file', required=False, help='Exclude directory.')
-
-    main(parser.parse_args())
+    parser.add_argument('--k', type=int, default=10, help='Rank cutoff for MAP, nDCG and Recall.')
+    parser.add_argument('--legacy', action='store_true', help='Only compute MRR, without NumPy.')
+    parser.add_argument('-t', '--trec', action='store_true',
+                        help='The runs are in TREC format, and are converted while they are read.')
+
+    args = parser.parse_args()
+    if not args.run and not args.runs:
+        parser.error('one of --run or --runs is required')
+    main(args)
@@ -1,56 +1,120 @@
-
 import glob
 import os
+import sys
+from contextlib import ExitStack
+from typing import Dict, Iterator, List, Set, Tuple
 
-with open("data/queries/docv2_train_queries.tsv", "r", encoding="utf8") as f:
-    original_queries = f.readlines()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src import instrument
 
-with open("data/output/0_rank.txt", "r", encoding="utf8") as f:
-    original_rank = f.readlines()
+ORIGINAL_QUERIES = "data/queries/docv2_train_queries.tsv"
+ORIGINAL_RANK = "data/output/0_rank.txt"
+QRELS = "data/queries/docv2_train_qrels.tsv"
+REDUCED = "data/output/reduced"
 
-os.makedirs("data/output/reduced", exist_ok=True)
 
-for filename in glob.glob("data/queries/*_fixed_queries.tsv"):
+def read_qid_lines(filename: str) -> Iterator[Tuple[str, str]]:
+    """Lazily yield `(qid, line)` for every line of `filename`, where the qid is
+    the first whitespace-separated field. Works for queries, TREC runs and qrels.
+    """
     with open(filename, "r", encoding="utf8") as f:
-        fixed_queries = f.readlines()
-    
-    # Gather the set of QID's for which _fixed_queries is different
+        for line in f:
+            yield line.split(None, 1)[0], line
+
+
+def read_query_index(filename: str) -> Dict[str, str]:
+    """Return a mapping from qid to query string for the queries in `filename`."""
+    queries = {}
+    with instrument.timer("reduce.index_queries") as timer:
+        with open(filename, "r", encoding="utf8") as f:
+            for line in f:
+                qid, _, query = line.rstrip("\n").partition("\t")
+                queries[qid] = query
+        timer.items = len(queries)
+    return queries
+
+
+def different_qids(original_queries: Dict[str, str], filename: str) -> Set[str]:
+    """Return the qids of the queries in `filename` that differ from `original_queries`."""
     different = set()
-    for original, fixed in zip(original_queries, fixed_queries):
-        if original != fixed:
-            orig_qid = original.split("\t")[0]
-            fixed_qid = fixed.split("\t")[0]
-
-            if orig_qid != fixed_qid:
-                raise Exception(f"Different QID: {orig_qid} vs {fixed_qid}")
-            
-            different.add(orig_qid)
-    
-    # Create a copy of 0_rank.txt and *_rank.txt, containing only QID's in `different`
-    prefix = os.path.basename(filename).split("_")[0]
-    with open(f"data/output/{prefix}_rank.txt", "r", encoding="utf8") as f:
-        fixed_rank = f.readlines()
-    
-    print(f"{prefix} modified {len(different)} queries out of {len(original_queries)} ({len(different) / len(original_queries) * 100:.2f}%).")
-
-    os.makedirs(f"data/output/reduced/{prefix}", exist_ok=True)
-
-    reduced_original_rank = [line for line in original_rank if line.split(" ")[0] in different]
-    reduced_fixed_rank = [line for line in fixed_rank if line.split(" ")[0] in different]
-
-    with open(f"data/output/reduced/{prefix}/original.txt", "w", encoding="utf8") as f:
-        f.write("".join(reduced_original_rank))
-    with open(f"data/output/reduced/{prefix}/fixed.txt", "w", encoding="utf8") as f:
-        f.write("".join(reduced_fixed_rank))
-
-    # Reduce qrels too
-    with open(f"data/queries/docv2_train_qrels.tsv", "r", encoding="utf8") as f:
-        qrels = f.readlines()
-
-    shrunk_qrels = [
-        qrel for qrel in qrels
-        if qrel.split("\t")[0] in different
-    ]
-
-    with open(f"data/output/reduced/{prefix}/qrels.txt", "w", encoding="utf8") as f:
-        f.write("".join(shrunk_qrels))
\ No newline at end of file
+    with instrument.timer("reduce.diff", len(original_queries)):
+        with open(filename, "r", encoding="utf8") as f:
+            for line in f:
+                qid, _, query = line.rstrip("\n").partition("\t")
+                if qid not in original_queries:
+                    raise Exception(f"Unknown QID {qid} in {filename}")
+                if original_queries[qid] != query:
+                    different.add(qid)
+    instrument.count(f"changed.{os.path.basename(filename)}", len(different))
+    return different
+
+
+def split_by_qid(
+    filename: str, outputs: Dict[str, List[str]], paths: List[str]
+) -> None:
+    """Copy each line of `filename` to the output files listed for its qid in
+    `outputs`, in a single pass over `filename`. All files in `paths` are created,
+    even if no lines are written to them.
+    """
+    with ExitStack() as stack:
+        stack.enter_context(instrument.timer("reduce.split"))
+        files = {
+            path: stack.enter_context(open(path, "w", encoding="utf8"))
+            for path in paths
+        }
+        targets = {
+            qid: [files[path] for path in qid_paths]
+            for qid, qid_paths in outputs.items()
+        }
+        for qid, line in read_qid_lines(filename):
+            for f in targets.get(qid, ()):
+                f.write(line)
+
+
+def reduce_all(fixed_queries_files: List[str]) -> None:
+    """Write the original and fixed rank and the qrels of only the queries that
+    were modified, for every file of fixed queries in `fixed_queries_files`.
+    Every input file is read exactly once.
+    """
+    original_queries = read_query_index(ORIGINAL_QUERIES)
+
+    # Map every modified qid to the reduced files it belongs in
+    original_outputs: Dict[str, List[str]] = {}
+    qrels_outputs: Dict[str, List[str]] = {}
+    prefixes = []
+    for filename in fixed_queries_files:
+        different = different_qids(original_queries, filename)
+        prefix = os.path.basename(filename).split("_")[0]
+        print(
+            f"{prefix} modified {len(different)} queries out of {len(original_queries)} ({len(different) / len(original_queries) * 100:.2f}%)."
+        )
+
+        prefixes.append(prefix)
+        os.makedirs(f"{REDUCED}/{prefix}", exist_ok=True)
+        for qid in different:
+            original_outputs.setdefault(qid, []).append(
+                f"{REDUCED}/{prefix}/original.txt"
+            )
+            qrels_outputs.setdefault(qid, []).append(f"{REDUCED}/{prefix}/qrels.txt")
+
+        # Create a copy of *_rank.txt, containing only QID's in `different`
+        split_by_qid(
+            f"data/output/{prefix}_rank.txt",
+            {qid: [f"{REDUCED}/{prefix}/fixed.txt"] for qid in different},
+            [f"{REDUCED}/{prefix}/fixed.txt"],
+        )
+
+    # Create copies of 0_rank.txt and the qrels for all prefixes at once
+    split_by_qid(
+        ORIGINAL_RANK,
+        original_outputs,
+        [f"{REDUCED}/{prefix}/original.txt" for prefix in prefixes],
+    )
+    split_by_qid(
+        QRELS, qrels_outputs, [f"{REDUCED}/{prefix}/qrels.txt" for prefix in prefixes]
+    )
+
+
+if __name__ == "__main__":
+    os.makedirs(REDUCED, exist_ok=True)
+    reduce_all(glob.glob("data/queries/*_fixed_queries.tsv"))
@@ -16,65 +16,103 @@
 
 import argparse
 import logging
+from itertools import islice
 
+from msmarco_doc_eval import autoopen
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser(
-        description='Converts a TREC run file to a MS MARCO-formatted run file.')
-    parser.add_argument('--input', required=True, default='', help='TREC-formatted run file')
-    parser.add_argument('--output', required=True, default='',
-                        help='output MS MARCO-formatted run file')
-    parser.add_argument('--k', type=int, default=-1,
-                        help='Number of hits to write to the run file. Write all hits if -1.')
-    parser.add_argument('--quiet', action='store_true', help="Suppresses all warnings.")
+# Number of lines written at once by `convert_run`
+CHUNK_LINES = 1 << 16
 
-    args = parser.parse_args()
 
-    with open(args.output, 'w') as fout:
-        last_score = None
-        last_query_id = ''
-        last_doc_id = ''
-        n_docs = 0
-        for line in open(args.input):
+def trec_to_msmarco_lines(lines, k=-1, quiet=False):
+    """Lazily convert the lines of a TREC-formatted run to MS MARCO-formatted lines.
+    Args:
+    lines (iterable): lines of "QUERYID Q0 DOCID RANK SCORE RUNID".
+    k (int): number of hits to keep per query, or -1 to keep all hits.
+    quiet (bool): suppress the warnings about ties and unordered hits. Ranks and scores
+        are validated, and ranks normalized, either way.
+    Yields:
+        str: lines of "QUERYID\tDOCID\tRANK\n"
+    """
+    last_score = None
+    last_rank = None
+    last_query_id = ''
+    last_doc_id = ''
+    n_docs = 0
+    for line in lines:
+        try:
             query_id, _, doc_id, rank, score, _ = line.strip().split(' ')
             rank = int(rank)
             score = float(score)
-            if query_id != last_query_id:
-                last_score = None
-                n_docs = 0
+        except ValueError:
+            raise IOError('\"%s\" is not valid format' % line.strip())
+        if query_id != last_query_id:
+            last_score = None
+            n_docs = 0
 
+        if not quiet:
             if last_score is not None:
-                if score == last_score and not args.quiet:
+                if score == last_score:
                     logging.warning(
                         f'Score of {score} for doc id {doc_id} is the same of doc id '
                         f'{last_doc_id} for query id {query_id}. This will likely impact metrics '
                         ' negatively.')
 
-                if rank == last_rank and not args.quiet:
+                if rank == last_rank:
                     logging.warning(
                         f'Rank of {rank} for doc id {doc_id} is the same of doc id '
                         f'{last_doc_id} for query id {query_id}. This will likely impact metrics '
                         ' negatively.')
 
-                if score > last_score and not args.quiet:
+                if score > last_score:
                     logging.warning(
                         f'Score of {score} for current doc id {doc_id} is greater than the score '
                         f'{last_score} of the previous doc id {last_doc_id} for query id '
                         f'{query_id}. This will likely impact metrics negatively.')
 
-                if rank < last_rank and not args.quiet:
+                if rank < last_rank:
                     logging.warning(
                         f'Rank of {rank} for current doc id {doc_id} is lower than the rank '
                         f'{last_rank} of the previous doc id {last_doc_id} for query id '
                         f'{query_id}. This will likely impact metrics negatively.')
-
-            if args.k == -1 or n_docs < args.k:
-                fout.write('{}\t{}\t{}\n'.format(query_id, doc_id, rank))
-
-            last_query_id = query_id
-            last_doc_id = doc_id
             last_score = score
             last_rank = rank
-            n_docs += 1
 
-    logging.info(f'Done! Wrote output file to {args.output}')
\ No newline at end of file
+        if k == -1 or n_docs < k:
+            yield '{}\t{}\t{}\n'.format(query_id, doc_id, rank)
+
+        last_query_id = query_id
+        last_doc_id = doc_id
+        n_docs += 1
+
+
+def convert_run(path_to_input, path_to_output, k=-1, quiet=False):
+    """Convert a TREC-formatted run file to a MS MARCO-formatted run file, in bulk writes.
+    Files ending with ".gz" or ".bz2" are transparently (de)compressed.
+    Args:
+    path_to_input (str): TREC-formatted run file.
+    path_to_output (str): output MS MARCO-formatted run file.
+    k (int): number of hits to keep per query, or -1 to keep all hits.
+    quiet (bool): suppress the warnings about ties and unordered hits.
+    """
+    with autoopen(path_to_input, 'r') as fin, autoopen(path_to_output, 'w') as fout:
+        lines = trec_to_msmarco_lines(fin, k=k, quiet=quiet)
+        while chunk := list(islice(lines, CHUNK_LINES)):
+            fout.write(''.join(chunk))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Converts a TREC run file to a MS MARCO-formatted run file.')
+    parser.add_argument('--input', required=True, default='', help='TREC-formatted run file')
+    parser.add_argument('--output', required=True, default='',
+                        help='output MS MARCO-formatted run file')
+    parser.add_argument('--k', type=int, default=-1,
+                        help='Number of hits to write to the run file. Write all hits if -1.')
+    parser.add_argument('--quiet', action='store_true', help="Suppresses all warnings.")
+
+    args = parser.parse_args()
+
+    convert_run(args.input, args.output, k=args.k, quiet=args.quiet)
+
+    logging.info(f'Done! Wrote output file to {args.output}')